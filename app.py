@@ -1,16 +1,108 @@
 # app.py
 
 from aiogram import executor
-from bot import dp
+from bot import dp, storage
 from handlers import register_handlers
-from database import init_db
+from database import init_db, engine
+from response_writer import response_writer
+from sender import sender
+from broadcast import broadcaster
+from quiz_cleanup import quiz_cleaner
+from quiz_schedule import quiz_scheduler
+from timer_wheel import timer_wheel
+from backup import backup_manager
+from quiz_cache import quiz_cache
+from middleware import ThrottlingMiddleware
+from logging_setup import log_stats
+from metrics import registry, instrument_handlers, instrument_engine, start_metrics_server
+from config import BOT_MODE, WORKER_PROCESSES, METRICS_ENABLED, THROTTLE_ENABLED, BACKUP_ENABLED
+
+throttling = ThrottlingMiddleware()
 
 async def on_startup(dp):
     await init_db()
+    await start_services(dp)
+    await start_singleton_services(dp)
     print("Бот запущен и готов к работе.")
 
-# Регистрируем обработчики
-register_handlers(dp)
+# Фоновые задачи процесса, который обрабатывает обновления
+async def start_services(dp, worker_index=0):
+    response_writer.start()
+    timer_wheel.start()
+    if METRICS_ENABLED:
+        # У каждого процесса-обработчика свой порт: METRICS_PORT + номер
+        dp['metrics_runner'] = await start_metrics_server(worker_index)
+
+# Задачи, которые должны выполняться только в одном процессе
+async def start_singleton_services(dp):
+    await broadcaster.resume()
+    await quiz_scheduler.start()
+    if BACKUP_ENABLED:
+        backup_manager.start()
+
+async def on_shutdown(dp):
+    # Записываем накопленные ответы и отправляем очередь сообщений перед остановкой
+    await broadcaster.stop()
+    await quiz_cleaner.stop()
+    quiz_scheduler.stop()
+    backup_manager.stop()
+    await timer_wheel.stop()
+    await response_writer.stop()
+    await sender.stop()
+    if dp.get('metrics_runner') is not None:
+        await dp['metrics_runner'].cleanup()
+
+# Метрики: время обработчиков и SQL-запросов, размеры очередей и кэшей.
+# Без METRICS_ENABLED не ставятся: обертки и события SQLAlchemy стоят времени
+# на каждом обработчике и запросе, а читать их некому.
+def setup_metrics(dp):
+    instrument_handlers(dp)
+    instrument_engine(engine)
+    registry.gauge('quiz_fsm_cached_states', "Состояний FSM в памяти", lambda: storage.stats()['cached'])
+    registry.gauge('quiz_fsm_pending_writes', "Несохраненных состояний FSM", lambda: storage.stats()['pending'])
+    registry.gauge('quiz_cache_size', "Квизов в кэше", lambda: quiz_cache.stats()['size'])
+    registry.callback_counter('quiz_cache_hits_total', "Попаданий в кэш квизов", lambda: quiz_cache.stats()['hits'])
+    registry.callback_counter('quiz_cache_misses_total', "Промахов кэша квизов", lambda: quiz_cache.stats()['misses'])
+    registry.gauge('quiz_response_queue_size', "Ответов в очереди на запись", lambda: response_writer.stats()['queued'])
+    registry.callback_counter('quiz_response_write_retries_total', "Повторов записи ответов", lambda: response_writer.stats()['retries'])
+    registry.callback_counter('quiz_responses_lost_total', "Ответов, не записанных после всех повторов", lambda: response_writer.stats()['failed'])
+    registry.gauge('quiz_send_queue_size', "Сообщений в очереди на отправку", lambda: sender.stats()['queued'])
+    registry.gauge('quiz_send_deferred', "Сообщений, ждущих лимита чата или повтора", lambda: sender.stats()['deferred'])
+    registry.callback_counter('quiz_updates_duplicate_total', "Отброшено повторных update_id", lambda: throttling.stats()['duplicate'])
+    registry.callback_counter('quiz_updates_repeated_total', "Отброшено повторных сообщений", lambda: throttling.stats()['repeat'])
+    registry.callback_counter('quiz_updates_throttled_total', "Отброшено сообщений сверх лимита", lambda: throttling.stats()['throttled'])
+    registry.gauge('quiz_log_queue_size', "Записей лога в очереди", lambda: log_stats()['queued'])
+    registry.callback_counter('quiz_log_dropped_total', "Записей лога отброшено при переполнении", lambda: log_stats()['dropped'])
+    registry.callback_counter('quiz_log_sampled_total', "Записей лога пропущено выборкой", lambda: log_stats()['sampled'])
+    registry.gauge('quiz_timers_pending', "Таймеров в колесе", lambda: len(timer_wheel))
+    registry.gauge('quiz_backup_running', "Идет резервное копирование", lambda: int(backup_manager.stats()['running']))
+    registry.gauge('quiz_backup_last_seconds', "Длительность последней резервной копии", lambda: backup_manager.stats()['seconds'])
+    registry.gauge('quiz_backup_last_size_bytes', "Размер последней резервной копии", lambda: backup_manager.stats()['size'])
+    registry.gauge('quiz_backup_last_finished', "Время окончания последней резервной копии (unix)", lambda: backup_manager.stats()['finished'])
+    registry.gauge('quiz_broadcasts_running', "Активных рассылок", lambda: len(broadcaster.progress()))
+    registry.gauge('quiz_cleanups_running', "Квизов в процессе удаления", lambda: len(quiz_cleaner.progress()))
+
+# Middleware, обработчики и метрики - один раз на процесс. При spawn модуль
+# выполняется дважды: как __mp_main__ и при импорте app в workers._serve,
+# а dp у обоих один и тот же.
+def setup_dispatcher(dp):
+    if dp.get('dispatcher_ready'):
+        return
+    dp['dispatcher_ready'] = True
+    if THROTTLE_ENABLED:
+        dp.middleware.setup(throttling)
+    register_handlers(dp)
+    if METRICS_ENABLED:
+        setup_metrics(dp)
+
+setup_dispatcher(dp)
 
 if __name__ == "__main__":
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    if WORKER_PROCESSES > 1:
+        from workers import start_workers
+        start_workers(WORKER_PROCESSES)
+    elif BOT_MODE == 'webhook':
+        from webhook import start_webhook
+        start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
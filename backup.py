@@ -0,0 +1,149 @@
+# backup.py
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.engine import make_url
+
+from timer_wheel import timer_wheel
+from config import (
+    DATABASE_URL,
+    BACKUP_DIRECTORY,
+    BACKUP_INTERVAL,
+    BACKUP_KEEP,
+)
+
+BACKUP_PREFIX = 'quiz-'
+BACKUP_SUFFIX = '.db.gz'
+# Журнал резервных копий: по строке JSON на копию
+BACKUP_LOG = 'backups.jsonl'
+
+
+def database_path(url=DATABASE_URL):
+    return make_url(url).database
+
+
+class BackupManager:
+    # Резервная копия через онлайн-API SQLite. Копирование и сжатие идут
+    # в отдельном потоке, цикл событий только запускает задачу и ждет ее.
+    def __init__(self, source=None, directory=BACKUP_DIRECTORY, interval=BACKUP_INTERVAL,
+                 keep=BACKUP_KEEP, wheel=timer_wheel):
+        self.source = source or database_path()
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.wheel = wheel
+        # Свой поток: копия не занимает пул, которым пользуются выгрузки
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='backup')
+        self._lock = asyncio.Lock()
+        self._timer = None
+        self.last = None  # Итоги последней копии
+
+    def start(self):
+        self._schedule()
+
+    def stop(self):
+        self.wheel.cancel(self._timer)
+        self._timer = None
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        last = self.last or {}
+        return {
+            'running': self._lock.locked(),
+            'seconds': last.get('seconds', 0.0),
+            'size': last.get('size', 0),
+            'finished': last.get('finished', 0.0),
+        }
+
+    def _schedule(self):
+        self.wheel.cancel(self._timer)
+        self._timer = self.wheel.schedule(self.interval, self._scheduled_backup)
+
+    async def _scheduled_backup(self):
+        try:
+            await self.backup()
+        except Exception:
+            logging.exception("Не удалось создать резервную копию базы.")
+        finally:
+            self._schedule()
+
+    async def backup(self):
+        if self._lock.locked():
+            return None
+        async with self._lock:
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(self._executor, self._backup)
+        self.last = result
+        logging.info(
+            f"Резервная копия {result['path']}: {result['size']} байт, "
+            f"{result['pages']} страниц за {result['seconds']:.2f} с"
+        )
+        return result
+
+    def _backup(self):
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.monotonic()
+        stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}")
+        raw_path = path[:-len('.gz')] + '.tmp'
+        pages = 0
+
+        def progress(status, remaining, total):
+            nonlocal pages
+            pages = total
+
+        try:
+            source = sqlite3.connect(self.source)
+            target = sqlite3.connect(raw_path)
+            try:
+                # Копия за один шаг. Порциями нельзя: SQLite начинает копирование
+                # заново, как только базу меняет другое соединение, и при постоянной
+                # записи копия не заканчивается никогда. В режиме WAL один шаг -
+                # это чтение снимка базы, запись игроков при этом не блокируется.
+                source.backup(target, pages=-1, progress=progress)
+            finally:
+                target.close()
+                source.close()
+            copied = time.monotonic()
+            with open(raw_path, 'rb') as raw, gzip.open(path + '.part', 'wb', compresslevel=6) as packed:
+                shutil.copyfileobj(raw, packed, 1024 * 1024)
+            os.replace(path + '.part', path)
+        finally:
+            for leftover in (raw_path, path + '.part'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        finished = time.monotonic()
+        result = {
+            'path': path,
+            'started': stamp,
+            'pages': pages,
+            'size': os.path.getsize(path),
+            'copy_seconds': round(copied - started, 3),
+            'seconds': round(finished - started, 3),
+            'finished': time.time(),
+        }
+        with open(os.path.join(self.directory, BACKUP_LOG), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        self._rotate()
+        return result
+
+    def _rotate(self):
+        # Имена содержат время создания, поэтому сортировка по имени - по возрасту
+        snapshots = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)
+        )
+        for name in snapshots[:-self.keep] if self.keep > 0 else ():
+            os.remove(os.path.join(self.directory, name))
+
+
+backup_manager = BackupManager()
@@ -0,0 +1,44 @@
+# benchmarks/bench_matching.py
+#
+# Микробенчмарк проверки ответов:
+#     python -m benchmarks.bench_matching
+
+import random
+import timeit
+
+from matching import AnswerMatcher
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def random_word(rng, length):
+    return ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def typo(rng, word):
+    position = rng.randrange(len(word))
+    return word[:position] + rng.choice(ALPHABET) + word[position + 1:]
+
+
+def bench(variant_count, number=20000, seed=1):
+    rng = random.Random(seed)
+    variants = [random_word(rng, rng.randint(4, 16)) for _ in range(variant_count)]
+    matcher = AnswerMatcher(variants)
+    cases = {
+        'точный ответ': variants[-1].upper() + '.',
+        'опечатка': typo(rng, variants[-1]),
+        'неверный ответ': random_word(rng, 12),
+    }
+    for name, answer in cases.items():
+        seconds = timeit.timeit(lambda: matcher.match(answer), number=number)
+        print(f"{variant_count:>5} вариантов, {name:<15} {seconds / number * 1e6:8.2f} мкс/ответ")
+
+
+if __name__ == '__main__':
+    compile_number = 100
+    for variant_count in (1, 10, 100, 1000):
+        rng = random.Random(0)
+        variants = [random_word(rng, 10) for _ in range(variant_count)]
+        seconds = timeit.timeit(lambda: AnswerMatcher(variants), number=compile_number)
+        print(f"{variant_count:>5} вариантов, сборка          {seconds / compile_number * 1e6:8.2f} мкс")
+        bench(variant_count, number=2000 if variant_count >= 1000 else 20000)
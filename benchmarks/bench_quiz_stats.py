@@ -0,0 +1,91 @@
+# benchmarks/bench_quiz_stats.py
+#
+# Статистика /quiz_stats на синтетических ответах (без БД):
+#     python -m benchmarks.bench_quiz_stats --responses 100000 1000000 5000000
+#
+# Для сравнения на первом размере считается и построчный вариант,
+# где каждый ответ проверяется отдельно.
+
+import argparse
+import random
+import time
+from collections import Counter
+
+from matching import AnswerMatcher
+from quiz_cache import CompiledQuestion
+from quiz_stats import ResponseColumns
+
+BATCH_SIZE = 50000
+
+
+def make_quiz(rng, question_count):
+    questions = []
+    vocabularies = []
+    for question_id in range(1, question_count + 1):
+        answer = f"правильный ответ {question_id}"
+        questions.append(CompiledQuestion(question_id, f"Вопрос {question_id}?", AnswerMatcher([answer])))
+        # Правильный ответ, опечатки и неверные ответы, как у живых игроков
+        vocabularies.append(
+            [answer, answer[:-1], answer + 'о'] + [f"неверно {question_id}-{i}" for i in range(30)]
+        )
+    return questions, vocabularies
+
+
+def make_rows(rng, vocabularies, response_count):
+    question_count = len(vocabularies)
+    rows = []
+    for index in range(response_count):
+        attempt_id, position = divmod(index, question_count)
+        vocabulary = vocabularies[position]
+        text = vocabulary[0] if rng.random() < 0.5 else rng.choice(vocabulary)
+        rows.append((attempt_id + 1, position + 1, text))
+    return rows
+
+
+def vectorized(questions, rows):
+    columns = ResponseColumns([question.question_id for question in questions])
+    for start in range(0, len(rows), BATCH_SIZE):
+        columns.add(rows[start:start + BATCH_SIZE])
+    return columns.compute(1, questions)
+
+
+def row_by_row(questions, rows):
+    by_id = {question.question_id: question for question in questions}
+    correct = Counter()
+    total = Counter()
+    answers = Counter()
+    for attempt_id, question_id, text in rows:
+        total[question_id] += 1
+        answers[question_id, text] += 1
+        if by_id[question_id].matcher.match(text):
+            correct[question_id] += 1
+    return {question_id: correct[question_id] / total[question_id] for question_id in total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк статистики по вопросам квиза")
+    parser.add_argument('--responses', type=int, nargs='+', default=[100000, 1000000, 3000000])
+    parser.add_argument('--questions', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    questions, vocabularies = make_quiz(rng, args.questions)
+    for number, response_count in enumerate(args.responses):
+        rows = make_rows(rng, vocabularies, response_count)
+        started = time.perf_counter()
+        stats = vectorized(questions, rows)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{response_count:>9} ответов: {elapsed:7.3f} с "
+            f"({response_count / elapsed / 1e6:.2f} млн/с), попыток {stats.finished_attempts}"
+        )
+        if number == 0:
+            started = time.perf_counter()
+            rates = row_by_row(questions, rows)
+            baseline = time.perf_counter() - started
+            assert all(abs(rates[q.question_id] - q.correct_rate) < 1e-9 for q in stats.questions)
+            print(f"{response_count:>9} ответов построчно: {baseline:7.3f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# benchmarks/bench_timer_wheel.py
+#
+# Колесо таймеров под нагрузкой, как у сотен тысяч игроков с лимитом времени:
+#     python -m benchmarks.bench_timer_wheel --timers 100000 500000
+
+import argparse
+import random
+import time
+
+from timer_wheel import TimerWheel
+
+
+def noop():
+    pass
+
+
+def bench(count, seed=1):
+    rng = random.Random(seed)
+    wheel = TimerWheel(tick=0.1)
+    delays = [rng.uniform(5, 120) for _ in range(count)]
+
+    started = time.perf_counter()
+    timers = [wheel.schedule(delay, noop) for delay in delays]
+    scheduled = time.perf_counter() - started
+
+    # Половина игроков отвечает до срока - их таймеры отменяются
+    started = time.perf_counter()
+    for timer in timers[::2]:
+        wheel.cancel(timer)
+    cancelled = time.perf_counter() - started
+
+    started = time.perf_counter()
+    wheel.advance(1200)  # 120 секунд при тике 0.1 с
+    advanced = time.perf_counter() - started
+
+    assert len(wheel) == 0 and wheel.fired == count - len(timers[::2])
+    print(
+        f"{count:>8} таймеров: вставка {scheduled / count * 1e6:.2f} мкс, "
+        f"отмена {cancelled / len(timers[::2]) * 1e6:.2f} мкс, "
+        f"1200 тиков {advanced * 1000:.1f} мс ({wheel.fired} срабатываний)"
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Бенчмарк колеса таймеров")
+    parser.add_argument('--timers', type=int, nargs='+', default=[10000, 100000, 500000])
+    args = parser.parse_args()
+    for count in args.timers:
+        bench(count)
@@ -0,0 +1,274 @@
+# benchmarks/loadtest.py
+#
+# Нагрузочный тест: бот работает против локальной заглушки Bot API,
+# виртуальные игроки проходят /start -> /quiz -> ответы -> итог.
+#     python -m benchmarks.loadtest --users 10 100 1000 --output loadtest.json
+#
+# Бот запускается в этом же процессе с отдельной временной базой.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from datetime import datetime
+
+from aiohttp import web
+
+import config
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'QuizBot', 'username': 'quiz_bot'}
+
+
+class FakeBotAPI:
+    # Заглушка Bot API: getUpdates отдает обновления виртуальных игроков,
+    # sendMessage и прочие методы складывают ответы бота во входящие игроков
+    def __init__(self):
+        self._updates = deque()
+        self._has_updates = asyncio.Event()
+        self._update_id = 0
+        self._message_id = 0
+        self.inboxes = {}
+        self.calls = {}
+
+    def inbox(self, chat_id):
+        inbox = self.inboxes.get(chat_id)
+        if inbox is None:
+            inbox = self.inboxes[chat_id] = asyncio.Queue()
+        return inbox
+
+    def push_text(self, user_id, text):
+        self._update_id += 1
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {
+                'id': user_id,
+                'is_bot': False,
+                'first_name': f'Игрок {user_id}',
+                'username': f'player{user_id}',
+            },
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self._updates.append({'update_id': self._update_id, 'message': message})
+        self._has_updates.set()
+
+    def _message(self, chat_id, text):
+        self._message_id += 1
+        return {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': text,
+        }
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = dict(await request.post())
+        handler = getattr(self, f'api_{method.lower()}', None)
+        if handler is None:
+            return web.json_response({'ok': True, 'result': True})
+        return web.json_response({'ok': True, 'result': await handler(params)})
+
+    async def api_getme(self, params):
+        return BOT_USER
+
+    async def api_getupdates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self._updates)[:limit]
+
+    async def api_sendmessage(self, params):
+        chat_id = int(params['chat_id'])
+        self.inbox(chat_id).put_nowait((time.perf_counter(), params.get('text', '')))
+        return self._message(chat_id, params.get('text', ''))
+
+    async def api_editmessagetext(self, params):
+        return self._message(int(params.get('chat_id') or 0), params.get('text', ''))
+
+    async def api_senddocument(self, params):
+        return self._message(int(params['chat_id']), '')
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def play(api, user_id, questions, accuracy, latencies):
+    inbox = api.inbox(user_id)
+
+    async def say(text):
+        sent = time.perf_counter()
+        api.push_text(user_id, text)
+        received, reply = await inbox.get()
+        latencies.append(received - sent)
+        return reply
+
+    await say('/start')
+    await say('/quiz')
+    for question in questions:
+        answer = question['answer'] if random.random() < accuracy else 'не знаю'
+        reply = await say(answer)
+    if not reply.startswith('Квиз завершен'):
+        raise RuntimeError(f"Игрок {user_id}: неожиданный ответ бота: {reply!r}")
+
+
+def db_writes(db_query_latency):
+    return sum(
+        series[-1]
+        for labels, series in db_query_latency._series.items()
+        if labels[0] in ('INSERT', 'UPDATE', 'DELETE')
+    )
+
+
+async def run(args):
+    from aiogram.bot.api import TelegramAPIServer
+
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+
+    # Импорт после подмены настроек: модули читают config при загрузке
+    import app as quiz_app
+    from bot import bot, dp
+    from database import async_session, engine, Quiz
+    from metrics import db_query_latency, instrument_engine
+    from quiz_import import save_quiz_to_db
+
+    bot.server = TelegramAPIServer.from_base(f'http://127.0.0.1:{args.port}')
+    # Метрики выключены, но записи в БД считаются по событиям движка
+    instrument_engine(engine)
+    await quiz_app.on_startup(dp)
+
+    questions = [
+        {'text': f'Вопрос {number}?', 'answer': f'ответ номер {number}'}
+        for number in range(1, args.questions + 1)
+    ]
+    quiz_id = await save_quiz_to_db({'title': 'Нагрузочный тест', 'questions': questions})
+    async with async_session() as session:
+        await session.execute(
+            Quiz.__table__.update().where(Quiz.quiz_id == quiz_id).values(is_active=True)
+        )
+        await session.commit()
+
+    polling = asyncio.get_event_loop().create_task(dp.start_polling(timeout=1, relax=0))
+    results = []
+    next_user_id = 1000
+    try:
+        for user_count in args.users:
+            latencies = []
+            user_ids = range(next_user_id, next_user_id + user_count)
+            next_user_id += user_count
+            writes_before = db_writes(db_query_latency)
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                play(api, user_id, questions, args.accuracy, latencies) for user_id in user_ids
+            ))
+            elapsed = time.perf_counter() - started
+            writes = db_writes(db_query_latency) - writes_before
+            result = {
+                'users': user_count,
+                'questions': args.questions,
+                'updates': len(latencies),
+                'seconds': round(elapsed, 3),
+                'updates_per_second': round(len(latencies) / elapsed, 1),
+                'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+                'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'db_writes': writes,
+                'db_writes_per_second': round(writes / elapsed, 1),
+            }
+            results.append(result)
+            print(
+                f"{user_count:>6} игроков: {result['updates_per_second']:>8} обн./с, "
+                f"p50 {result['latency_p50_ms']} мс, p99 {result['latency_p99_ms']} мс, "
+                f"запись в БД {result['db_writes_per_second']}/с"
+            )
+    finally:
+        dp.stop_polling()
+        await dp.wait_closed()
+        polling.cancel()
+        await quiz_app.on_shutdown(dp)
+        await dp.storage.close()
+        session = await bot.get_session()
+        await session.close()
+        await runner.cleanup()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальной заглушке Bot API")
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--accuracy', type=float, default=0.7, help="Доля правильных ответов")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="Оставить лимиты отправки Telegram (по умолчанию сняты)")
+    parser.add_argument('--output', default='loadtest.json')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='quiz_loadtest_')
+    config.DATABASE_URL = 'sqlite+aiosqlite:///' + os.path.join(directory, 'quiz.db')
+    config.FSM_DATABASE_PATH = os.path.join(directory, 'fsm.db')
+    config.METRICS_ENABLED = False
+    # Виртуальные игроки отвечают быстрее живых и упирались бы в защиту от флуда
+    config.THROTTLE_ENABLED = False
+    config.BACKUP_ENABLED = False
+    if not args.telegram_limits:
+        config.SEND_GLOBAL_RATE = 1000000
+        config.SEND_CHAT_RATE = 1000000
+        config.SEND_CHAT_BURST = 1000000
+    random.seed(1)
+    try:
+        results = asyncio.get_event_loop().run_until_complete(run(args))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'telegram_limits': args.telegram_limits,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,14 @@
 # bot.py
 
-import logging
 from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
-from config import API_TOKEN
+from config import API_TOKEN, FSM_DATABASE_PATH
+from logging_setup import setup_logging
+from sqlite_storage import SQLiteStorage
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования: запись в фоновом потоке через очередь
+setup_logging()
 
 # Инициализируем бота и диспетчер
 bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+storage = SQLiteStorage(FSM_DATABASE_PATH)
 dp = Dispatcher(bot, storage=storage)
@@ -0,0 +1,173 @@
+# broadcast.py
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import select, func
+
+from database import async_session, Broadcast, User
+from sender import sender, BULK
+from config import BROADCAST_CHUNK_SIZE, BROADCAST_CONCURRENCY
+
+
+class Broadcaster:
+    # Рассылка по таблице users порциями по user_id (keyset-пагинация).
+    # После каждой порции прогресс сохраняется, и после перезапуска
+    # рассылка продолжается со следующей порции.
+    def __init__(self, chunk_size=BROADCAST_CHUNK_SIZE, concurrency=BROADCAST_CONCURRENCY):
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self._tasks = {}
+        self._progress = {}  # broadcast_id -> счетчики текущего запуска
+
+    async def start(self, quiz_id, text, admin_chat_id):
+        async with async_session() as session:
+            result = await session.execute(select(func.count()).select_from(User))
+            total = result.scalar()
+            broadcast = Broadcast(
+                quiz_id=quiz_id,
+                text=text,
+                admin_chat_id=admin_chat_id,
+                status='running',
+                last_user_id=0,
+                total=total,
+                sent=0,
+                failed=0,
+                started_at=datetime.utcnow(),
+            )
+            session.add(broadcast)
+            await session.commit()
+        self._spawn(broadcast)
+        return broadcast.broadcast_id
+
+    async def resume(self):
+        async with async_session() as session:
+            result = await session.execute(
+                select(Broadcast).where(Broadcast.status == 'running')
+            )
+            broadcasts = result.scalars().all()
+        for broadcast in broadcasts:
+            if broadcast.broadcast_id not in self._tasks:
+                logging.info(f"Продолжаем рассылку {broadcast.broadcast_id} с user_id > {broadcast.last_user_id}")
+                self._spawn(broadcast)
+
+    async def stop(self):
+        # Прогресс уже сохранен после последней порции
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def progress(self):
+        # [(broadcast_id, quiz_id, отправлено, ошибок, всего, сообщений в секунду)]
+        result = []
+        now = time.monotonic()
+        for broadcast_id, progress in self._progress.items():
+            elapsed = now - progress['started']
+            rate = progress['sent_now'] / elapsed if elapsed > 0 else 0.0
+            result.append((
+                broadcast_id,
+                progress['quiz_id'],
+                progress['sent'],
+                progress['failed'],
+                progress['total'],
+                rate,
+            ))
+        return result
+
+    def _spawn(self, broadcast):
+        self._progress[broadcast.broadcast_id] = {
+            'quiz_id': broadcast.quiz_id,
+            'sent': broadcast.sent,
+            'failed': broadcast.failed,
+            'total': broadcast.total,
+            'sent_now': 0,
+            'started': time.monotonic(),
+        }
+        task = asyncio.get_event_loop().create_task(self._run(broadcast))
+        self._tasks[broadcast.broadcast_id] = task
+
+    def _format_progress(self, broadcast_id):
+        progress = self._progress[broadcast_id]
+        elapsed = time.monotonic() - progress['started']
+        rate = progress['sent_now'] / elapsed if elapsed > 0 else 0.0
+        return (
+            f"Рассылка {broadcast_id}: отправлено {progress['sent']} из {progress['total']}, "
+            f"ошибок {progress['failed']}, {rate:.1f} сообщ./с"
+        )
+
+    async def _run(self, broadcast):
+        broadcast_id = broadcast.broadcast_id
+        progress = self._progress[broadcast_id]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_user_id = broadcast.last_user_id
+        progress_message = None
+
+        async def deliver(telegram_id):
+            async with semaphore:
+                try:
+                    await sender.send_message(telegram_id, broadcast.text, priority=BULK)
+                    return True
+                except Exception as e:
+                    # Пользователь заблокировал бота, удалил аккаунт и т. п.
+                    logging.info(f"Рассылка {broadcast_id}: не доставлено {telegram_id}: {e}")
+                    return False
+
+        try:
+            if broadcast.admin_chat_id:
+                progress_message = await sender.send_message(
+                    broadcast.admin_chat_id, self._format_progress(broadcast_id)
+                )
+            while True:
+                async with async_session() as session:
+                    result = await session.execute(
+                        select(User.user_id, User.telegram_id)
+                        .where(User.user_id > last_user_id)
+                        .order_by(User.user_id)
+                        .limit(self.chunk_size)
+                    )
+                    chunk = result.fetchall()
+                if not chunk:
+                    break
+                delivered = await asyncio.gather(*(deliver(row.telegram_id) for row in chunk))
+                sent = sum(delivered)
+                progress['sent'] += sent
+                progress['sent_now'] += sent
+                progress['failed'] += len(delivered) - sent
+                last_user_id = chunk[-1].user_id
+                # Контрольная точка: после перезапуска начнем со следующей порции
+                async with async_session() as session:
+                    await session.execute(
+                        Broadcast.__table__.update()
+                        .where(Broadcast.broadcast_id == broadcast_id)
+                        .values(last_user_id=last_user_id, sent=progress['sent'], failed=progress['failed'])
+                    )
+                    await session.commit()
+                if progress_message is not None:
+                    try:
+                        await sender.edit_text(progress_message, self._format_progress(broadcast_id))
+                    except Exception:
+                        logging.exception("Не удалось обновить прогресс рассылки.")
+            async with async_session() as session:
+                await session.execute(
+                    Broadcast.__table__.update()
+                    .where(Broadcast.broadcast_id == broadcast_id)
+                    .values(status='done', finished_at=datetime.utcnow())
+                )
+                await session.commit()
+            if broadcast.admin_chat_id:
+                await sender.send_message(
+                    broadcast.admin_chat_id, "Рассылка завершена. " + self._format_progress(broadcast_id)
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f"Рассылка {broadcast_id} прервана.")
+        finally:
+            self._tasks.pop(broadcast_id, None)
+            self._progress.pop(broadcast_id, None)
+
+
+broadcaster = Broadcaster()
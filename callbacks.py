@@ -0,0 +1,60 @@
+# callbacks.py
+
+import logging
+from collections import namedtuple
+
+from aiogram import types
+
+from helpers import is_admin
+from metrics import instrument_handler
+from sender import sender
+
+# Разобранные callback_data: "activate:5" -> CallbackAction('activate', 5)
+CallbackAction = namedtuple('CallbackAction', ['name', 'arg'])
+
+# Старые форматы кнопок, которые могли остаться в уже отправленных сообщениях
+LEGACY_NAMES = {
+    'confirm_cancel': 'cancel',
+}
+
+
+def callback_data(name, arg=None):
+    return name if arg is None else f"{name}:{arg}"
+
+
+def parse_callback_data(data):
+    name, separator, arg = data.partition(':')
+    if not separator:
+        # Старый формат "activate_5"
+        prefix, _, suffix = data.rpartition('_')
+        if prefix and suffix.isdigit():
+            name, arg = prefix, suffix
+        else:
+            name, arg = LEGACY_NAMES.get(data, data), ''
+    return CallbackAction(name, int(arg) if arg.isdigit() else (arg or None))
+
+
+class CallbackRouter:
+    # Таблица действий: callback_data разбирается один раз, обработчик
+    # находится поиском в словаре, права администратора проверяются здесь же
+    def __init__(self):
+        self._routes = {}
+
+    def route(self, name, admin_only=True):
+        def decorator(handler):
+            self._routes[name] = (instrument_handler(handler), admin_only)
+            return handler
+        return decorator
+
+    async def dispatch(self, callback_query: types.CallbackQuery):
+        action = parse_callback_data(callback_query.data or '')
+        route = self._routes.get(action.name)
+        if route is None:
+            logging.info(f"Неизвестное действие кнопки: '{callback_query.data}'")
+            await sender.answer_callback(callback_query, "Действие больше недоступно.")
+            return
+        handler, admin_only = route
+        if admin_only and not await is_admin(callback_query.from_user.username):
+            await sender.answer_callback(callback_query, "У вас нет прав для выполнения этой команды.", show_alert=True)
+            return
+        await handler(callback_query, action)
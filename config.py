@@ -2,5 +2,96 @@
 
 API_TOKEN = '7645679841:AAF9Kj-r8PIyFM_vVooVDlrLMF28p4Faf9g'  # Замените на ваш реальный токен
 
+# Логирование: JSON-строки пишет отдельный поток, обработчики не ждут диска
+LOG_LEVEL = 'INFO'
+LOG_FILE = ''  # Пусто - писать в stdout
+LOG_QUEUE_SIZE = 10000  # Записей в очереди; при переполнении новые отбрасываются
+LOG_SAMPLE_LIMIT = 20  # Записей в секунду с одного места в коде (WARNING и выше - все); 0 - без ограничения
+
 # Путь к базе данных
 DATABASE_URL = 'sqlite+aiosqlite:///data/quiz.db'
+DATABASE_POOL_SIZE = 5  # Постоянные соединения с SQLite
+DATABASE_MAX_OVERFLOW = 10  # Дополнительные соединения при пиковой нагрузке
+
+# Путь к базе состояний FSM (незавершенные попытки переживают перезапуск)
+FSM_DATABASE_PATH = 'data/fsm.db'
+
+# Режим получения обновлений: 'polling' или 'webhook'
+BOT_MODE = 'polling'
+
+# Настройки вебхука
+WEBHOOK_URL = ''  # Публичный адрес, например 'https://example.com'; пусто - не вызывать setWebhook
+WEBHOOK_PATH = '/webhook'
+WEBHOOK_SECRET = ''  # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = '0.0.0.0'
+WEBAPP_PORT = 8080
+WEBHOOK_WORKERS = 32  # Сколько обработчиков выполняется одновременно
+WEBHOOK_QUEUE_SIZE = 10000  # Сколько обновлений можно принять в очередь
+
+# Количество процессов-обработчиков; 0 или 1 - все в одном процессе
+WORKER_PROCESSES = 0
+WORKER_QUEUE_SIZE = 10000  # Очередь обновлений на каждый процесс
+WORKER_REPORT_INTERVAL = 60  # Как часто писать в лог пропускную способность (секунды)
+
+# Лимиты исходящих запросов к Telegram
+SEND_GLOBAL_RATE = 30  # Сообщений в секунду на бота
+SEND_CHAT_RATE = 1  # Сообщений в секунду в один чат
+SEND_CHAT_BURST = 3  # Сколько сообщений в чат можно отправить подряд
+SENDER_WORKERS = 50  # Одновременно выполняемых запросов
+SEND_MAX_RETRIES = 5  # Повторов при RetryAfter и сетевых ошибках
+
+# Защита от флуда: лимит входящих сообщений и нажатий на пользователя
+THROTTLE_ENABLED = True
+THROTTLE_RATE = 2  # Сообщений в секунду
+THROTTLE_BURST = 5  # Сколько сообщений можно отправить подряд
+THROTTLE_MAX_USERS = 100000  # Сколько пользователей помнить
+REPEAT_WINDOW = 1.0  # Одинаковые сообщения подряд за это время считаются повтором (секунды)
+DEDUP_WINDOW = 10000  # Сколько последних update_id помнить для отсева повторной доставки
+
+# Лидерборд
+LEADERBOARD_SIZE = 10  # Сколько мест показывать в /leaderboard
+WINNER_PLACES = 1  # Сколько мест считаются победными при деактивации квиза
+LEADERBOARD_RELOAD_INTERVAL = 30  # Перечитывать таблицу в многопроцессном режиме (секунды)
+LEADERBOARD_CACHE_SIZE = 100  # Сколько лидербордов держать в памяти
+
+# Рассылка объявлений о квизах
+BROADCAST_CHUNK_SIZE = 500  # Пользователей за один шаг (и между контрольными точками)
+BROADCAST_CONCURRENCY = 25  # Одновременных отправок
+
+# Списки квизов в клавиатурах
+QUIZ_PAGE_SIZE = 8  # Квизов на одной странице
+QUIZ_CATALOG_TTL = 30  # Как часто перечитывать список активных квизов (секунды)
+
+QUIZ_CACHE_TTL = 30  # Как долго процесс держит скомпилированный квиз (секунды)
+
+# Выгрузка результатов
+EXPORT_CHUNK_SIZE = 1000  # Строк за одно чтение из курсора
+
+# Таймеры: ограничение времени на вопрос и расписание квизов
+TIMER_TICK = 0.1  # Точность срабатывания таймеров (секунды)
+QUIZ_SCHEDULE_RELOAD = 60  # Как часто перечитывать расписание квизов (секунды)
+
+# Резервные копии базы (онлайн-API SQLite, без остановки бота)
+BACKUP_ENABLED = True
+BACKUP_DIRECTORY = 'data/backups'
+BACKUP_INTERVAL = 6 * 3600  # Как часто делать копию (секунды)
+BACKUP_KEEP = 7  # Сколько последних копий хранить
+
+# Удаление и архивирование квизов
+CLEANUP_CHUNK_SIZE = 500  # Строк за одну транзакцию
+CLEANUP_PAUSE = 0.05  # Пауза между порциями, чтобы не мешать игрокам (секунды)
+ARCHIVE_DIRECTORY = 'data/archive'  # Куда сохранять архив удаленных квизов
+
+# Статистика /quiz_stats (нужен NumPy)
+STATS_CHUNK_SIZE = 50000  # Ответов за одно чтение из курсора
+STATS_TOP_ANSWERS = 3  # Сколько самых частых ответов показывать по вопросу
+STATS_QUESTIONS_SHOWN = 10  # Сколько самых сложных вопросов показывать
+STATS_CACHE_TTL = 60  # Как долго хранить посчитанную статистику квиза (секунды)
+
+# Проверка ответов: сколько опечаток прощать в длинных ответах
+FUZZY_MAX_DISTANCE = 2
+
+# Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_ENABLED = True
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9100
@@ -1,9 +1,10 @@
 # database.py
 
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, func
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, Text, Index, event, func, inspect, text
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 Base = declarative_base()
 
@@ -11,6 +12,8 @@ class Admin(Base):
     __tablename__ = 'admins'
     admin_id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, nullable=False)
+    # Юзернейм без '@' в нижнем регистре: поиск по индексу вместо ilike
+    username_normalized = Column(String, unique=True, index=True)
 
 class User(Base):
     __tablename__ = 'users'
@@ -27,21 +30,29 @@ class Quiz(Base):
     start_time = Column(DateTime)
     end_time = Column(DateTime)
     question_count = Column(Integer)
+    question_time_limit = Column(Integer)  # Секунд на вопрос; пусто - без ограничения
+    # Режим экзамена: все вопросы одним сообщением, ответы одним сообщением
+    is_exam = Column(Boolean, nullable=False, default=False)
+    # Активируется и деактивируется по start_time/end_time; ручное переключение снимает флаг
+    is_scheduled = Column(Boolean, nullable=False, default=False)
 
 class Question(Base):
     __tablename__ = 'questions'
     question_id = Column(Integer, primary_key=True)
-    quiz_id = Column(Integer, ForeignKey('quizzes.quiz_id'))
+    quiz_id = Column(Integer, ForeignKey('quizzes.quiz_id'), index=True)
     text = Column(Text)
 
 class Answer(Base):
     __tablename__ = 'answers'
     answer_id = Column(Integer, primary_key=True)
-    question_id = Column(Integer, ForeignKey('questions.question_id'))
+    question_id = Column(Integer, ForeignKey('questions.question_id'), index=True)
     text = Column(Text, nullable=False)  # Хранит правильный ответ
 
 class UserAttempt(Base):
     __tablename__ = 'user_attempts'
+    __table_args__ = (
+        Index('ix_user_attempts_user_quiz', 'user_id', 'quiz_id'),
+    )
     attempt_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.user_id'))
     quiz_id = Column(Integer, ForeignKey('quizzes.quiz_id'))
@@ -52,30 +63,124 @@ class UserAttempt(Base):
 class UserResponse(Base):
     __tablename__ = 'user_responses'
     response_id = Column(Integer, primary_key=True)
-    attempt_id = Column(Integer, ForeignKey('user_attempts.attempt_id'))
+    attempt_id = Column(Integer, ForeignKey('user_attempts.attempt_id'), index=True)
     question_id = Column(Integer, ForeignKey('questions.question_id'))
     selected_answer_text = Column(Text)
 
+class LeaderboardEntry(Base):
+    # Лучший результат пользователя в квизе; обновляется при завершении попытки
+    __tablename__ = 'leaderboard'
+    quiz_id = Column(Integer, ForeignKey('quizzes.quiz_id'), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    username = Column(String)
+    best_score = Column(Integer, nullable=False)
+    achieved_at = Column(DateTime)
+
+class UserStats(Base):
+    # Итоги пользователя по всем квизам; обновляются при завершении попытки,
+    # чтобы /mystats читал одну строку по первичному ключу
+    __tablename__ = 'user_stats'
+    user_id = Column(Integer, primary_key=True)  # Telegram id, как в user_attempts
+    attempts = Column(Integer, nullable=False, default=0)
+    total_score = Column(Integer, nullable=False, default=0)
+    total_questions = Column(Integer, nullable=False, default=0)
+    best_score = Column(Integer, nullable=False, default=0)
+    current_streak = Column(Integer, nullable=False, default=0)  # Дней подряд с пройденным квизом
+    best_streak = Column(Integer, nullable=False, default=0)
+    last_played_on = Column(Date)
+    last_played_at = Column(DateTime)
+
+class Broadcast(Base):
+    # Рассылка объявления о квизе; last_user_id - контрольная точка для продолжения
+    __tablename__ = 'broadcasts'
+    broadcast_id = Column(Integer, primary_key=True)
+    quiz_id = Column(Integer, ForeignKey('quizzes.quiz_id'))
+    text = Column(Text, nullable=False)
+    admin_chat_id = Column(Integer)
+    status = Column(String, nullable=False, index=True)  # running, done, cancelled
+    last_user_id = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
 # Инициализация базы данных
 from config import DATABASE_URL
 
+from config import DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW
+
+# Профиль производительности SQLite, применяется к каждому новому соединению
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",  # 64 МБ
+    "PRAGMA mmap_size=268435456",  # 256 МБ
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
 engine = create_async_engine(
     DATABASE_URL,
     echo=False,
+    # Соединения переиспользуются, а не открываются на каждую сессию
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DATABASE_POOL_SIZE,
+    max_overflow=DATABASE_MAX_OVERFLOW,
 )
 
+@event.listens_for(engine.sync_engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
 async_session = sessionmaker(
     engine, expire_on_commit=False, class_=AsyncSession
 )
 
+# Дополняет существующую базу колонками и индексами, которые create_all не добавляет
+def upgrade_schema(connection):
+    admin_columns = {column['name'] for column in inspect(connection).get_columns('admins')}
+    if 'username_normalized' not in admin_columns:
+        connection.execute(text("ALTER TABLE admins ADD COLUMN username_normalized VARCHAR"))
+        connection.execute(text("UPDATE admins SET username_normalized = lower(ltrim(username, '@'))"))
+    quiz_columns = {column['name'] for column in inspect(connection).get_columns('quizzes')}
+    if 'question_time_limit' not in quiz_columns:
+        connection.execute(text("ALTER TABLE quizzes ADD COLUMN question_time_limit INTEGER"))
+    if 'is_scheduled' not in quiz_columns:
+        connection.execute(text("ALTER TABLE quizzes ADD COLUMN is_scheduled BOOLEAN NOT NULL DEFAULT 0"))
+    if 'is_exam' not in quiz_columns:
+        connection.execute(text("ALTER TABLE quizzes ADD COLUMN is_exam BOOLEAN NOT NULL DEFAULT 0"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    # Новая таблица user_stats заполняется по уже сохраненным попыткам
+    # (незавершенные попытки без ответов не учитываются; история серий не
+    # восстанавливается, серия - 1 за день последней игры)
+    if connection.execute(text("SELECT 1 FROM user_stats LIMIT 1")).first() is None:
+        connection.execute(text(
+            "INSERT INTO user_stats (user_id, attempts, total_score, total_questions, best_score, "
+            "current_streak, best_streak, last_played_on, last_played_at) "
+            "SELECT a.user_id, count(*), sum(a.correct_answers), sum(coalesce(q.question_count, 0)), "
+            "max(a.correct_answers), 1, 1, date(max(a.timestamp)), max(a.timestamp) "
+            "FROM user_attempts a LEFT JOIN quizzes q ON q.quiz_id = a.quiz_id "
+            "WHERE a.user_id IS NOT NULL AND EXISTS "
+            "(SELECT 1 FROM user_responses r WHERE r.attempt_id = a.attempt_id) "
+            "GROUP BY a.user_id"
+        ))
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+        await conn.execute(text("PRAGMA optimize"))
     # Добавляем суперпользователя (замените 'maierra' на ваш реальный юзернейм)
     async with async_session() as session:
         result = await session.execute(Admin.__table__.select())
         admins = result.fetchall()
         if not admins:
-            new_admin = Admin(username='MaierrA')  # Замените на ваш юзернейм без '@'
+            new_admin = Admin(username='MaierrA', username_normalized='maierra')  # Замените на ваш юзернейм без '@'
             session.add(new_admin)
             await session.commit()
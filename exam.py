@@ -0,0 +1,72 @@
+# exam.py
+
+import re
+
+from database import async_session, UserAttempt, UserResponse
+from helpers import normalize_answer
+
+# Ответ в режиме экзамена: "3. Париж", "3) Париж" или "3 - Париж"
+EXAM_ANSWER_RE = re.compile(r'^\s*(\d+)\s*[.):-]\s*(.*)$')
+
+# Предел длины сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+# Все вопросы одним сообщением; если не помещаются - несколькими, по целым вопросам
+def format_exam(compiled, header):
+    messages = []
+    current = header
+    for number, question in enumerate(compiled.questions, start=1):
+        line = f"\n{number}. {question.text}"
+        if len(current) + len(line) > MESSAGE_LIMIT:
+            messages.append(current)
+            current = line.lstrip('\n')
+        else:
+            current += line
+    messages.append(current)
+    return messages
+
+
+# Номер вопроса -> текст ответа; строка без номера продолжает предыдущий ответ
+def parse_numbered_answers(text):
+    answers = {}
+    number = None
+    for line in text.splitlines():
+        match = EXAM_ANSWER_RE.match(line)
+        if match:
+            number = int(match.group(1))
+            answers[number] = match.group(2).strip()
+        elif number is not None and line.strip():
+            answers[number] = f"{answers[number]} {line.strip()}".strip()
+    return answers
+
+
+# Проверка всего ответа за один проход; возвращает число верных и строки user_responses
+def grade_exam(compiled, attempt_id, answers):
+    correct_answers = 0
+    rows = []
+    for number, question in enumerate(compiled.questions, start=1):
+        answer = answers.get(number)
+        if answer:
+            if question.matcher is not None and question.matcher.match(answer):
+                correct_answers += 1
+            answer = normalize_answer(answer)
+        rows.append({
+            'attempt_id': attempt_id,
+            'question_id': question.question_id,
+            # Пустой ответ - вопрос без ответа, как при истечении времени
+            'selected_answer_text': answer or None,
+        })
+    return correct_answers, rows
+
+
+# Все ответы и итог попытки - одной транзакцией
+async def save_exam_attempt(attempt_id, rows, correct_answers):
+    async with async_session() as session:
+        await session.execute(UserResponse.__table__.insert(), rows)
+        await session.execute(
+            UserAttempt.__table__.update()
+            .where(UserAttempt.attempt_id == attempt_id)
+            .values(correct_answers=correct_answers)
+        )
+        await session.commit()
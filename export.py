@@ -0,0 +1,100 @@
+# export.py
+
+import asyncio
+import csv
+import gzip
+import json
+import os
+
+from sqlalchemy import select
+
+from database import engine, UserAttempt, UserResponse
+from config import EXPORT_CHUNK_SIZE
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_COLUMNS = (
+    'attempt_id',
+    'user_id',
+    'quiz_id',
+    'timestamp',
+    'correct_answers',
+    'is_winner',
+    'response_id',
+    'question_id',
+    'selected_answer_text',
+)
+
+# Одновременно выполняется одна выгрузка, чтобы не мешать игрокам
+_export_lock = asyncio.Lock()
+
+
+class CsvExportWriter:
+    def __init__(self, f):
+        self._writer = csv.writer(f)
+        self._writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(
+            [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+            for row in rows
+        )
+
+
+class JsonlExportWriter:
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, rows):
+        self._f.write(''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, default=str) + '\n'
+            for row in rows
+        ))
+
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'jsonl': JsonlExportWriter,
+}
+
+
+def results_query(quiz_id):
+    return (
+        select(
+            UserAttempt.attempt_id,
+            UserAttempt.user_id,
+            UserAttempt.quiz_id,
+            UserAttempt.timestamp,
+            UserAttempt.correct_answers,
+            UserAttempt.is_winner,
+            UserResponse.response_id,
+            UserResponse.question_id,
+            UserResponse.selected_answer_text,
+        )
+        .outerjoin(UserResponse, UserResponse.attempt_id == UserAttempt.attempt_id)
+        .where(UserAttempt.quiz_id == quiz_id)
+        .order_by(UserAttempt.attempt_id, UserResponse.response_id)
+    )
+
+
+# Выгружает результаты квиза в сжатый файл; в памяти держится одна порция строк
+async def export_results(quiz_id, file_format, directory, chunk_size=EXPORT_CHUNK_SIZE):
+    path = os.path.join(directory, f"quiz_{quiz_id}_results.{file_format}.gz")
+    loop = asyncio.get_event_loop()
+    row_count = 0
+    async with _export_lock:
+        f = await loop.run_in_executor(None, lambda: gzip.open(path, 'wt', encoding='utf-8', newline=''))
+        try:
+            writer = EXPORT_WRITERS[file_format](f)
+            async with engine.connect() as conn:
+                result = await conn.stream(
+                    results_query(quiz_id).execution_options(yield_per=chunk_size)
+                )
+                async for rows in result.partitions(chunk_size):
+                    rows = [tuple(row) for row in rows]
+                    # Форматирование и сжатие - в отдельном потоке, цикл событий свободен
+                    await loop.run_in_executor(None, writer.write, rows)
+                    row_count += len(rows)
+        finally:
+            await loop.run_in_executor(None, f.close)
+    return path, row_count
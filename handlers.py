@@ -1,24 +1,42 @@
 # handlers.py
 
+import asyncio
 import logging
+import os
+import shutil
+import tempfile
+import time
 from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from datetime import datetime, timedelta
-
-from bot import dp, bot
-from helpers import is_admin
+from datetime import datetime
+from sqlalchemy import select
+
+from helpers import admin_cache, is_admin, normalize_answer, normalize_username, display_name, register_user, quiz_exists
+from leaderboard import leaderboards
+from quiz_stats import quiz_stats, np
+from user_stats import record_attempt, get_user_stats, current_streak
+from config import LEADERBOARD_SIZE, STATS_QUESTIONS_SHOWN
+from quiz_cache import quiz_cache
+from quiz_catalog import quiz_catalog
+from quiz_schedule import set_quiz_active
+from timer_wheel import timer_wheel
+from backup import backup_manager
+from exam import format_exam, parse_numbered_answers, grade_exam, save_exam_attempt
+from quiz_import import parse_quiz_data, save_quiz_to_db, import_quiz_file, detect_format
+from response_writer import response_writer
+from sender import sender
+from callbacks import CallbackRouter
+from broadcast import broadcaster
+from quiz_cleanup import quiz_cleaner
+from export import export_results, EXPORT_FORMATS
 from database import (
     async_session,
-    User,
     Quiz,
-    Question,
-    Answer,
     UserAttempt,
-    UserResponse,
     Admin,
 )
-from keyboards import admin_main_menu, confirm_keyboard, quiz_list_keyboard
+from keyboards import admin_main_menu, delete_keyboard, quiz_list_keyboard, broadcast_keyboard
 
 # Состояния для FSM
 class AdminStates(StatesGroup):
@@ -27,20 +45,37 @@ class AdminStates(StatesGroup):
 
 class QuizStates(StatesGroup):
     answering_questions = State()
+    answering_exam = State()
     waiting_for_email = State()
 
+# Списки квизов в клавиатурах: действие -> (какие квизы, заголовок, текст для пустого списка)
+QUIZ_LISTS = {
+    'activate': ('inactive', "Выберите квиз для активации:", "Нет неактивных квизов."),
+    'deactivate': ('active', "Выберите квиз для деактивации:", "Нет активных квизов."),
+    'delete': ('all', "Выберите квиз для удаления:", "Нет квизов для удаления."),
+    'play': ('active', "Выберите квиз:", "Сейчас нет доступных квизов."),
+}
+
 def register_handlers(dp: Dispatcher):
+    # Повторный вызов не должен добавлять обработчики второй раз
+    if dp.get('handlers_registered'):
+        return
+    dp['handlers_registered'] = True
+
     # Обработчик команды /start
     @dp.message_handler(commands=['start'])
     async def send_welcome(message: types.Message):
         username = message.from_user.username
+        await register_user(message.from_user)
         if await is_admin(username):
-            await message.reply(
+            await sender.reply(
+                message,
                 "Добро пожаловать в панель администратора.\nВведите /help для просмотра доступных команд.",
                 reply_markup=admin_main_menu()
             )
         else:
-            await message.reply(
+            await sender.reply(
+                message,
                 "Привет! Готовы начать квиз? Напишите /quiz, чтобы начать.\nВведите /help для просмотра доступных команд."
             )
 
@@ -57,6 +92,11 @@ def register_handlers(dp: Dispatcher):
                 "/delete\\_quiz \\- Удалить квиз\\n"
                 "/add\\_admin @username \\- Добавить администратора\\n"
                 "/remove\\_admin @username \\- Удалить администратора\\n"
+                "/broadcasts \\- Прогресс рассылок\\n"
+                "/export\\_results <номер\\> \\[csv\\|jsonl\\] \\- Выгрузить результаты квиза\\n"
+                "/quiz\\_stats <номер\\> \\- Сложность вопросов квиза\\n"
+                "/backup \\- Сделать резервную копию базы\\n"
+                "/stats \\- Статистика работы бота\\n"
                 "/help \\- Показать это сообщение\\n\\n"
                 "**Добавление квиза\\:**\\n"
                 "Чтобы добавить новый квиз, используйте команду /add\\_quiz и следуйте инструкциям\\. "
@@ -76,21 +116,20 @@ def register_handlers(dp: Dispatcher):
                 "2\\. 2 \\+ 2 \\= \\?\\n"
                 "Ответ\\: 4\\n"
             )
-            await message.reply(help_text, parse_mode='MarkdownV2')
+            await sender.reply(message, help_text, parse_mode='MarkdownV2')
         else:
             help_text = (
                 "Доступные команды для пользователя:\\n"
                 "/quiz \\- Начать квиз\\n"
+                "/leaderboard \\- Таблица лидеров\\n"
+                "/myrank \\- Ваше место в квизе\\n"
+                "/mystats \\- Ваша статистика\\n"
                 "/help \\- Показать это сообщение\\n"
             )
-            await message.reply(help_text, parse_mode='MarkdownV2')
+            await sender.reply(message, help_text, parse_mode='MarkdownV2')
 
     # Обработчик команды /add_quiz
     async def add_quiz_handler(user_id):
-        username = await get_username(user_id)
-        if not await is_admin(username):
-            await bot.send_message(user_id, "У вас нет прав для выполнения этой команды.")
-            return
         instructions = (
             "Пожалуйста, отправьте данные квиза в следующем формате:\n\n"
             "Название квиза: Название вашего квиза\n"
@@ -106,9 +145,17 @@ def register_handlers(dp: Dispatcher):
             "1. Столица Франции?\n"
             "Ответ: Париж\n"
             "2. 2 + 2 = ?\n"
-            "Ответ: 4\n"
+            "Ответ: 4\n\n"
+            "Несколько правильных вариантов указываются через |, например: Ответ: Париж | Paris. "
+            "Регистр, ё/е, знаки препинания и небольшие опечатки в длинных ответах не учитываются.\n\n"
+            "Перед списком вопросов можно добавить необязательные строки:\n"
+            "Время на вопрос: 30 (секунд)\n"
+            "Режим: экзамен - все вопросы одним сообщением, ответы одним сообщением\n"
+            "Начало: 2024-09-01 10:00 и Конец: 2024-09-01 12:00 (UTC) - квиз включится и выключится сам.\n\n"
+            "Большой банк вопросов можно прислать файлом: текст в том же формате, "
+            "CSV (вопрос,ответ) или JSON Lines ({\"question\": ..., \"answer\": ...}).\n"
         )
-        await bot.send_message(user_id, instructions)
+        await sender.send_message(user_id, instructions)
         await AdminStates.waiting_for_quiz_data.set()
 
     # Обработчик получения данных квиза
@@ -118,247 +165,390 @@ def register_handlers(dp: Dispatcher):
         try:
             quiz_info = parse_quiz_data(quiz_data)
             await save_quiz_to_db(quiz_info)
-            await message.reply("Квиз успешно создан и сохранен.")
+            await sender.reply(message, "Квиз успешно создан и сохранен.")
             await state.finish()
         except Exception as e:
             logging.exception("Ошибка при парсинге квиза.")
-            await message.reply(f"Ошибка при создании квиза: {str(e)}\nПожалуйста, проверьте формат и попробуйте снова.")
+            await sender.reply(message, f"Ошибка при создании квиза: {str(e)}\nПожалуйста, проверьте формат и попробуйте снова.")
             await state.finish()
 
-    # Функция для получения юзернейма по user_id
-    async def get_username(user_id):
-        user = await bot.get_chat(user_id)
-        return user.username
-
-    # Обработчик нажатий на кнопки меню администратора
-    @dp.callback_query_handler(lambda c: c.data.startswith('admin_'))
-    async def process_admin_menu(callback_query: types.CallbackQuery):
-        action = callback_query.data
-        username = callback_query.from_user.username
-        user_id = callback_query.from_user.id
-        logging.info(f"Проверка администратора в CallbackQuery: '{username}'")
-        if not await is_admin(username):
-            await callback_query.answer("У вас нет прав для выполнения этой команды.", show_alert=True)
-            return
-
-        if action == 'admin_add_quiz':
-            await add_quiz_handler(user_id)
-        elif action == 'admin_activate_quiz':
-            await activate_quiz_handler(user_id)
-        elif action == 'admin_deactivate_quiz':
-            await deactivate_quiz_handler(user_id)
-        elif action == 'admin_delete_quiz':
-            await delete_quiz_handler(user_id)
-        elif action == 'admin_add_admin':
-            await bot.send_message(user_id, "Пожалуйста, используйте команду:\n/add_admin @username")
-        elif action == 'admin_help':
-            await bot.send_message(user_id, "Введите /help для просмотра доступных команд.")
-        await callback_query.answer()
-
-    # Команда /activate_quiz
-    async def activate_quiz_handler(user_id):
-        username = await get_username(user_id)
-        if not await is_admin(username):
-            await bot.send_message(user_id, "У вас нет прав для выполнения этой команды.")
-            return
-        async with async_session() as session:
-            result = await session.execute(
-                Quiz.__table__.select().where(Quiz.is_active == False)
-            )
-            quizzes = result.fetchall()
-            if not quizzes:
-                await bot.send_message(user_id, "Нет неактивных квизов.")
-                return
-            await bot.send_message(user_id, "Выберите квиз для активации:", reply_markup=quiz_list_keyboard(quizzes, 'activate'))
+    # Обработчик загрузки квиза из файла
+    @dp.message_handler(state=AdminStates.waiting_for_quiz_data, content_types=types.ContentType.DOCUMENT)
+    async def process_quiz_file(message: types.Message, state: FSMContext):
+        document = message.document
+        file_format = detect_format(document.file_name)
+        default_title = message.caption or os.path.splitext(document.file_name or 'Квиз')[0]
+        progress_message = await sender.reply(message, "Загружаю файл...")
 
-    # Команда /deactivate_quiz
-    async def deactivate_quiz_handler(user_id):
-        username = await get_username(user_id)
-        if not await is_admin(username):
-            await bot.send_message(user_id, "У вас нет прав для выполнения этой команды.")
-            return
-        async with async_session() as session:
-            result = await session.execute(
-                Quiz.__table__.select().where(Quiz.is_active == True)
-            )
-            quizzes = result.fetchall()
-            if not quizzes:
-                await bot.send_message(user_id, "Нет активных квизов.")
-                return
-            await bot.send_message(user_id, "Выберите квиз для деактивации:", reply_markup=quiz_list_keyboard(quizzes, 'deactivate'))
+        async def report_progress(question_count):
+            await sender.edit_text(progress_message, f"Импортировано вопросов: {question_count}")
 
-    # Команда /delete_quiz
-    async def delete_quiz_handler(user_id):
-        username = await get_username(user_id)
-        if not await is_admin(username):
-            await bot.send_message(user_id, "У вас нет прав для выполнения этой команды.")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'quiz_upload')
+            try:
+                await document.download(destination_file=path)
+                quiz_id, title, question_count = await import_quiz_file(
+                    path, file_format, default_title, progress=report_progress
+                )
+                await sender.reply(message, f"Квиз «{title}» (ID: {quiz_id}) сохранен, вопросов: {question_count}.")
+            except Exception as e:
+                logging.exception("Ошибка при импорте квиза из файла.")
+                await sender.reply(message, f"Ошибка при импорте квиза: {str(e)}\nПожалуйста, проверьте формат и попробуйте снова.")
+        await state.finish()
+
+    # Кнопки обрабатываются через таблицу действий: один обработчик aiogram,
+    # дальше поиск по имени действия в словаре
+    router = CallbackRouter()
+    dp.register_callback_query_handler(router.dispatch)
+
+    # Кнопки меню администратора
+    @router.route('admin_add_quiz')
+    async def admin_add_quiz(callback_query: types.CallbackQuery, action):
+        await add_quiz_handler(callback_query.from_user.id)
+        await sender.answer_callback(callback_query)
+
+    @router.route('admin_activate_quiz')
+    async def admin_activate_quiz(callback_query: types.CallbackQuery, action):
+        await send_quiz_list(callback_query.from_user.id, 'activate')
+        await sender.answer_callback(callback_query)
+
+    @router.route('admin_deactivate_quiz')
+    async def admin_deactivate_quiz(callback_query: types.CallbackQuery, action):
+        await send_quiz_list(callback_query.from_user.id, 'deactivate')
+        await sender.answer_callback(callback_query)
+
+    @router.route('admin_delete_quiz')
+    async def admin_delete_quiz(callback_query: types.CallbackQuery, action):
+        await send_quiz_list(callback_query.from_user.id, 'delete')
+        await sender.answer_callback(callback_query)
+
+    @router.route('admin_add_admin')
+    async def admin_add_admin(callback_query: types.CallbackQuery, action):
+        await sender.send_message(callback_query.from_user.id, "Пожалуйста, используйте команду:\n/add_admin @username")
+        await sender.answer_callback(callback_query)
+
+    @router.route('admin_help')
+    async def admin_help(callback_query: types.CallbackQuery, action):
+        await sender.send_message(callback_query.from_user.id, "Введите /help для просмотра доступных команд.")
+        await sender.answer_callback(callback_query)
+
+    # Первая страница списка квизов для действия из QUIZ_LISTS
+    async def send_quiz_list(chat_id, action):
+        kind, prompt, empty = QUIZ_LISTS[action]
+        page = await quiz_catalog.page(kind)
+        if not page.quizzes:
+            await sender.send_message(chat_id, empty)
+            return
+        await sender.send_message(chat_id, prompt, reply_markup=quiz_list_keyboard(page, action))
+
+    # Кнопки "назад" и "далее": сообщение со списком редактируется на месте
+    async def turn_quiz_page(callback_query: types.CallbackQuery, action):
+        list_action = action.name[:-len('_page')]
+        kind, prompt, empty = QUIZ_LISTS[list_action]
+        cursor = str(action.arg or '')
+        if cursor[:1] not in ('<', '>') or not cursor[1:].isdigit():
+            await sender.answer_callback(callback_query, "Действие больше недоступно.")
             return
+        page = await quiz_catalog.page(kind, cursor[0], int(cursor[1:]))
+        await sender.edit_text(
+            callback_query.message,
+            prompt if page.quizzes else empty,
+            reply_markup=quiz_list_keyboard(page, list_action)
+        )
+        await sender.answer_callback(callback_query)
+
+    for list_action in QUIZ_LISTS:
+        router.route(f"{list_action}_page", admin_only=list_action != 'play')(turn_quiz_page)
+
+    # Активация квиза
+    @router.route('activate')
+    async def activate_quiz(callback_query: types.CallbackQuery, action):
+        quiz_id = action.arg
+        await set_quiz_active(quiz_id, True, manual=True)
+        await sender.answer_callback(callback_query, "Квиз активирован.", show_alert=True)
+        await sender.send_message(
+            callback_query.from_user.id,
+            "Разослать объявление о квизе всем пользователям?",
+            reply_markup=broadcast_keyboard(quiz_id)
+        )
+
+    # Деактивация квиза
+    @router.route('deactivate')
+    async def deactivate_quiz(callback_query: types.CallbackQuery, action):
+        quiz_id = action.arg
+        winners = await set_quiz_active(quiz_id, False, manual=True)
+        await sender.answer_callback(
+            callback_query, f"Квиз деактивирован. Победителей: {len(winners)}.", show_alert=True
+        )
+
+    # Удаление квиза: запрашиваем подтверждение
+    @router.route('delete')
+    async def delete_quiz(callback_query: types.CallbackQuery, action):
+        await sender.send_message(
+            callback_query.from_user.id,
+            "Вы уверены, что хотите удалить этот квиз?",
+            reply_markup=delete_keyboard(action.arg)
+        )
+        await sender.answer_callback(callback_query)
+
+    # Запуск рассылки объявления о квизе
+    @router.route('broadcast')
+    async def start_broadcast(callback_query: types.CallbackQuery, action):
+        quiz_id = action.arg
         async with async_session() as session:
-            result = await session.execute(
-                Quiz.__table__.select()
-            )
-            quizzes = result.fetchall()
-            if not quizzes:
-                await bot.send_message(user_id, "Нет квизов для удаления.")
-                return
-            await bot.send_message(user_id, "Выберите квиз для удаления:", reply_markup=quiz_list_keyboard(quizzes, 'delete'))
-
-    # Обработчик нажатий на кнопки активации, деактивации и удаления квиза
-    @dp.callback_query_handler(lambda c: c.data.startswith(('activate_', 'deactivate_', 'delete_')))
-    async def process_quiz_action(callback_query: types.CallbackQuery):
-        action, quiz_id = callback_query.data.split('_')
-        quiz_id = int(quiz_id)
-        username = callback_query.from_user.username
-        user_id = callback_query.from_user.id
-        logging.info(f"Проверка администратора в CallbackQuery: '{username}'")
-        if not await is_admin(username):
-            await callback_query.answer("У вас нет прав для выполнения этой команды.", show_alert=True)
+            result = await session.execute(select(Quiz.title).where(Quiz.quiz_id == quiz_id))
+            title = result.scalar()
+        if title is None:
+            await sender.answer_callback(callback_query, "Квиз не найден.", show_alert=True)
             return
+        broadcast_id = await broadcaster.start(
+            quiz_id,
+            f"Стартовал новый квиз «{title}»! Напишите /quiz, чтобы начать.",
+            callback_query.from_user.id,
+        )
+        await sender.answer_callback(callback_query, f"Рассылка {broadcast_id} запущена.")
 
-        if action == 'activate':
-            async with async_session() as session:
-                await session.execute(
-                    Quiz.__table__.update()
-                    .where(Quiz.quiz_id == quiz_id)
-                    .values(is_active=True)
-                )
-                await session.commit()
-            await callback_query.answer("Квиз активирован.", show_alert=True)
-        elif action == 'deactivate':
-            async with async_session() as session:
-                await session.execute(
-                    Quiz.__table__.update()
-                    .where(Quiz.quiz_id == quiz_id)
-                    .values(is_active=False)
-                )
-                await session.commit()
-            await callback_query.answer("Квиз деактивирован.", show_alert=True)
-        elif action == 'delete':
-            # Запрашиваем подтверждение
-            await bot.send_message(
-                user_id,
-                "Вы уверены, что хотите удалить этот квиз?",
-                reply_markup=confirm_keyboard(f'confirm_delete_confirm_{quiz_id}')
-            )
-        await callback_query.answer()
-
-    # Обработчик подтверждения удаления квиза
-    @dp.callback_query_handler(lambda c: c.data.startswith('confirm_delete_confirm_'))
-    async def confirm_delete_quiz(callback_query: types.CallbackQuery):
-        quiz_id = int(callback_query.data.split('_')[-1])
-        username = callback_query.from_user.username
-        user_id = callback_query.from_user.id
-        logging.info(f"Проверка администратора в CallbackQuery: '{username}'")
+    # Кнопка "Нет" в подтверждениях
+    @router.route('cancel', admin_only=False)
+    async def cancel_action(callback_query: types.CallbackQuery, action):
+        await sender.answer_callback(callback_query, "Действие отменено.")
+
+    # Прогресс рассылок
+    @dp.message_handler(commands=['broadcasts'])
+    async def broadcasts_handler(message: types.Message):
+        username = message.from_user.username
         if not await is_admin(username):
-            await callback_query.answer("У вас нет прав для выполнения этой команды.", show_alert=True)
+            await sender.reply(message, "У вас нет прав для выполнения этой команды.")
             return
+        progress = broadcaster.progress()
+        if not progress:
+            await sender.reply(message, "Сейчас рассылок нет.")
+            return
+        lines = [
+            f"Рассылка {broadcast_id} (квиз {quiz_id}): {sent} из {total}, ошибок {failed}, {rate:.1f} сообщ./с"
+            for broadcast_id, quiz_id, sent, failed, total, rate in progress
+        ]
+        await sender.reply(message, "\n".join(lines))
+
+    # Подтверждение удаления квиза: строки удаляются в фоне по частям
+    @router.route('delete_confirm')
+    async def confirm_delete_quiz(callback_query: types.CallbackQuery, action):
+        await start_quiz_cleanup(callback_query, action.arg, archive=False)
+
+    @router.route('archive_confirm')
+    async def confirm_archive_quiz(callback_query: types.CallbackQuery, action):
+        await start_quiz_cleanup(callback_query, action.arg, archive=True)
+
+    async def start_quiz_cleanup(callback_query: types.CallbackQuery, quiz_id, archive):
+        if quiz_cleaner.start(quiz_id, callback_query.from_user.id, archive=archive):
+            await sender.answer_callback(callback_query, "Удаление квиза запущено.")
+        else:
+            await sender.answer_callback(callback_query, "Этот квиз уже удаляется.", show_alert=True)
 
-        async with async_session() as session:
-            # Удаляем ответы
-            await session.execute(
-                Answer.__table__.delete().where(
-                    Answer.question_id.in_(
-                        session.query(Question.question_id).filter(
-                            Question.quiz_id == quiz_id
-                        )
-                    )
-                )
-            )
-            # Удаляем вопросы
-            await session.execute(
-                Question.__table__.delete().where(Question.quiz_id == quiz_id)
-            )
-            # Удаляем квиз
-            await session.execute(
-                Quiz.__table__.delete().where(Quiz.quiz_id == quiz_id)
-            )
-            await session.commit()
-        await callback_query.answer("Квиз успешно удален.", show_alert=True)
-
-    # Обработчик команды /quiz для пользователей
+    # Обработчик команды /quiz для пользователей: /quiz <номер> или выбор из активных
     @dp.message_handler(commands=['quiz'])
     async def start_quiz(message: types.Message, state: FSMContext):
-        async with async_session() as session:
-            result = await session.execute(
-                Quiz.__table__.select().where(Quiz.is_active == True)
-            )
-            quiz_row = result.fetchone()
-            if not quiz_row:
-                await message.reply("Сейчас нет доступных квизов.")
+        await register_user(message.from_user)
+        args = message.get_args()
+        active = await quiz_catalog.active()
+        if args and args.strip().isdigit():
+            quiz_id = int(args.strip())
+            if not await quiz_catalog.is_active(quiz_id):
+                await sender.reply(message, "Квиз не найден или сейчас недоступен.")
                 return
-            quiz = Quiz(**quiz_row)
-            result = await session.execute(
-                Question.__table__.select().where(Question.quiz_id == quiz.quiz_id)
-            )
-            questions = result.fetchall()
-            await state.update_data(
-                questions=[Question(**q) for q in questions],
-                current_question=0,
-                correct_answers=0,
-                quiz_id=quiz.quiz_id
-            )
-            # Создаем попытку
+        elif len(active) == 1:
+            quiz_id = active[0].quiz_id
+        elif active:
+            kind, prompt, empty = QUIZ_LISTS['play']
+            page = await quiz_catalog.page(kind)
+            await sender.reply(message, prompt, reply_markup=quiz_list_keyboard(page, 'play'))
+            return
+        else:
+            await sender.reply(message, "Сейчас нет доступных квизов.")
+            return
+        await begin_quiz(message.chat.id, message.from_user, state, quiz_id)
+
+    # Выбор квиза кнопкой из списка
+    @router.route('play', admin_only=False)
+    async def play_quiz(callback_query: types.CallbackQuery, action):
+        if not isinstance(action.arg, int) or not await quiz_catalog.is_active(action.arg):
+            await sender.answer_callback(callback_query, "Этот квиз уже недоступен.", show_alert=True)
+            return
+        await sender.answer_callback(callback_query)
+        state = dp.current_state(chat=callback_query.message.chat.id, user=callback_query.from_user.id)
+        await begin_quiz(callback_query.message.chat.id, callback_query.from_user, state, action.arg)
+
+    async def begin_quiz(chat_id, user: types.User, state: FSMContext, quiz_id):
+        compiled = await quiz_cache.get(quiz_id)
+        if compiled is None:
+            await sender.send_message(chat_id, "Сейчас нет доступных квизов.")
+            return
+        # Создаем попытку
+        async with async_session() as session:
             new_attempt = UserAttempt(
-                user_id=message.from_user.id,
-                quiz_id=quiz.quiz_id,
+                user_id=user.id,
+                quiz_id=quiz_id,
                 timestamp=datetime.utcnow(),
                 correct_answers=0,
                 is_winner=False
             )
             session.add(new_attempt)
             await session.commit()
-            await state.update_data(attempt_id=new_attempt.attempt_id)
-            await send_question(message.chat.id, state)
-            await QuizStates.answering_questions.set()
+        await state.set_data({
+            'current_question': 0,
+            'correct_answers': 0,
+            'quiz_id': quiz_id,
+            'attempt_id': new_attempt.attempt_id,
+        })
+        # Состояние ставим до отправки вопроса: ответ может прийти сразу
+        if compiled.exam:
+            await state.set_state(QuizStates.answering_exam)
+            await send_exam(chat_id, state, user, compiled)
+            return
+        await state.set_state(QuizStates.answering_questions)
+        await send_question(chat_id, state, user)
+
+    # Таймеры вопросов с ограничением времени: user_id -> Timer общего колеса
+    question_timers = {}
+    # Игроки, у которых таймер уже сработал и обработка еще идет
+    timing_out = set()
+
+    def cancel_question_timer(user_id):
+        timer_wheel.cancel(question_timers.pop(user_id, None))
+
+    def question_timeout(chat_id, user: types.User, question_index):
+        question_timers.pop(user.id, None)
+        timing_out.add(user.id)
+        return expire_question(chat_id, user, question_index)
+
+    # Время вышло: вопрос засчитывается как неотвеченный, отправляется следующий
+    async def expire_question(chat_id, user: types.User, question_index):
+        try:
+            state = dp.current_state(chat=chat_id, user=user.id)
+            current_state = await state.get_state()
+            if current_state == QuizStates.answering_exam.state:
+                await sender.send_message(chat_id, "Время на ответ истекло.")
+                await finish_exam(chat_id, state, user, await state.get_data(), {})
+                return
+            if current_state != QuizStates.answering_questions.state:
+                return
+            data = await state.get_data()
+            if data.get('current_question') != question_index:
+                return
+            await skip_question(chat_id, state, user, data)
+        finally:
+            timing_out.discard(user.id)
+
+    async def skip_question(chat_id, state: FSMContext, user: types.User, data):
+        question_index = data['current_question']
+        compiled = await quiz_cache.get(data['quiz_id'])
+        if compiled is not None and question_index < len(compiled.questions):
+            # Пустой ответ в user_responses - вопрос без ответа
+            await response_writer.put(data['attempt_id'], compiled.questions[question_index].question_id, None)
+        await state.update_data(current_question=question_index + 1)
+        await sender.send_message(chat_id, "Время на ответ истекло.")
+        await send_question(chat_id, state, user)
 
     # Функция отправки вопроса
-    async def send_question(chat_id, state: FSMContext):
+    async def send_question(chat_id, state: FSMContext, user: types.User):
         data = await state.get_data()
-        questions = data['questions']
+        compiled = await quiz_cache.get(data['quiz_id'])
+        questions = compiled.questions if compiled else ()
         current_question = data['current_question']
 
         if current_question < len(questions):
             question = questions[current_question]
-            await bot.send_message(chat_id, question.text)
+            if not compiled.time_limit:
+                await sender.send_message(chat_id, question.text)
+                return
+            await sender.send_message(chat_id, f"{question.text}\n\n⏱ {compiled.time_limit} с на ответ")
+            # Отсчет - с момента отправки: ожидание в лимитах отправки не сокращает время.
+            # Срок хранится и в состоянии: таймеры не переживают перезапуск
+            await state.update_data(deadline=time.time() + compiled.time_limit)
+            cancel_question_timer(user.id)
+            question_timers[user.id] = timer_wheel.schedule(
+                compiled.time_limit, question_timeout, chat_id, user, current_question
+            )
         else:
             # Квиз завершен
-            await finish_quiz(chat_id, state)
+            await finish_quiz(chat_id, state, user)
+
+    # Режим экзамена: все вопросы одним сообщением, на все время - сумма лимитов
+    async def send_exam(chat_id, state: FSMContext, user: types.User, compiled):
+        header = "Ответьте на все вопросы одним сообщением, по строке на вопрос: «1. ответ».\n"
+        time_limit = (compiled.time_limit or 0) * len(compiled.questions)
+        if time_limit:
+            header += f"⏱ {time_limit} с на все ответы.\n"
+        for text in format_exam(compiled, header):
+            await sender.send_message(chat_id, text)
+        if time_limit:
+            # Как в send_question: срок и таймер - после отправки всех вопросов
+            await state.update_data(deadline=time.time() + time_limit)
+            cancel_question_timer(user.id)
+            question_timers[user.id] = timer_wheel.schedule(time_limit, question_timeout, chat_id, user, 0)
+
+    @dp.message_handler(state=QuizStates.answering_exam)
+    async def process_exam_answer(message: types.Message, state: FSMContext):
+        if message.from_user.id in timing_out:
+            return
+        data = await state.get_data()
+        deadline = data.get('deadline')
+        if deadline is not None and time.time() > deadline:
+            cancel_question_timer(message.from_user.id)
+            await sender.reply(message, "Время на ответ истекло.")
+            await finish_exam(message.chat.id, state, message.from_user, data, {})
+            return
+        answers = parse_numbered_answers(message.text or '')
+        if not answers:
+            await sender.reply(message, "Пришлите ответы одним сообщением с номерами вопросов, например:\n1. Париж\n2. 4")
+            return
+        cancel_question_timer(message.from_user.id)
+        await finish_exam(message.chat.id, state, message.from_user, data, answers)
+
+    # Проверка и сохранение экзамена: один проход по вопросам, одна транзакция
+    async def finish_exam(chat_id, state: FSMContext, user: types.User, data, answers):
+        compiled = await quiz_cache.get(data['quiz_id'])
+        if compiled is None:
+            await sender.send_message(chat_id, "Ошибка: квиз больше недоступен.")
+            await state.finish()
+            return
+        correct_answers, rows = grade_exam(compiled, data['attempt_id'], answers)
+        await save_exam_attempt(data['attempt_id'], rows, correct_answers)
+        await announce_result(chat_id, state, user, data['quiz_id'], correct_answers, len(rows))
 
     # Обработка ответов пользователей
     @dp.message_handler(state=QuizStates.answering_questions)
     async def process_answer(message: types.Message, state: FSMContext):
-        user_answer = message.text.strip().lower()
+        if message.from_user.id in timing_out:
+            # Ответ опоздал: следующий вопрос уже отправляет таймер
+            return
+        cancel_question_timer(message.from_user.id)
+        user_answer = normalize_answer(message.text)
         data = await state.get_data()
+        deadline = data.get('deadline')
+        if deadline is not None and time.time() > deadline:
+            # Таймер потерян при перезапуске, но срок уже прошел
+            await skip_question(message.chat.id, state, message.from_user, data)
+            return
         correct_answers = data.get('correct_answers', 0)
         current_question = data.get('current_question', 0)
-        questions = data['questions']
         attempt_id = data['attempt_id']
-        question = questions[current_question]
-
-        async with async_session() as session:
-            result = await session.execute(
-                Answer.__table__.select().where(Answer.question_id == question.question_id)
-            )
-            correct_answer_row = result.fetchone()
-            if correct_answer_row:
-                correct_answer = Answer(**correct_answer_row)
-                correct_answer_text = correct_answer.text.strip().lower()
-            else:
-                await message.reply("Ошибка: не найден правильный ответ на вопрос.")
-                await state.finish()
-                return
+        compiled = await quiz_cache.get(data['quiz_id'])
+        if compiled is None or current_question >= len(compiled.questions):
+            await sender.reply(message, "Ошибка: квиз больше недоступен.")
+            await state.finish()
+            return
+        question = compiled.questions[current_question]
+        if question.matcher is None:
+            await sender.reply(message, "Ошибка: не найден правильный ответ на вопрос.")
+            await state.finish()
+            return
 
-            if user_answer == correct_answer_text:
-                correct_answers += 1
+        if question.matcher.match(message.text):
+            correct_answers += 1
 
-            # Сохраняем ответ пользователя
-            new_response = UserResponse(
-                attempt_id=attempt_id,
-                question_id=question.question_id,
-                selected_answer_text=user_answer,
-            )
-            session.add(new_response)
-            await session.commit()
+        # Сохраняем ответ пользователя (запись пачкой в фоне)
+        await response_writer.put(attempt_id, question.question_id, user_answer)
 
         current_question += 1
         await state.update_data(
@@ -366,13 +556,17 @@ def register_handlers(dp: Dispatcher):
             current_question=current_question,
         )
 
-        await send_question(message.chat.id, state)
+        await send_question(message.chat.id, state, message.from_user)
 
     # Завершение квиза
-    async def finish_quiz(chat_id, state: FSMContext):
+    async def finish_quiz(chat_id, state: FSMContext, user: types.User):
+        cancel_question_timer(user.id)
         data = await state.get_data()
         correct_answers = data.get('correct_answers', 0)
         attempt_id = data['attempt_id']
+        quiz_id = data['quiz_id']
+        # Дописываем ответы попытки, которые еще в буфере
+        await response_writer.flush()
         async with async_session() as session:
             # Обновляем попытку
             await session.execute(
@@ -381,119 +575,266 @@ def register_handlers(dp: Dispatcher):
                 .values(correct_answers=correct_answers)
             )
             await session.commit()
-        await bot.send_message(chat_id, f"Квиз завершен! Вы ответили правильно на {correct_answers} вопросов.")
+        await announce_result(chat_id, state, user, quiz_id, correct_answers, data.get('current_question', 0))
+
+    # Итог попытки: лидерборд, личная статистика, сообщение игроку
+    async def announce_result(chat_id, state: FSMContext, user: types.User, quiz_id, correct_answers, question_count):
+        if not await quiz_exists(quiz_id):
+            # Квиз удалили, пока игрок отвечал: результат некуда записывать
+            await sender.send_message(chat_id, "Квиз был удален, результат не сохранен.")
+            await state.finish()
+            return
+        finished_at = datetime.utcnow()
+        await leaderboards.record(quiz_id, user.id, display_name(user), correct_answers, finished_at)
+        await record_attempt(user.id, correct_answers, question_count, finished_at)
+        quiz_stats.invalidate(quiz_id)
+        board = await leaderboards.get(quiz_id)
+        text = f"Квиз завершен! Вы ответили правильно на {correct_answers} вопросов."
+        # Квиз могли удалить сразу после проверки выше
+        rank = board.rank(user.id) if board is not None else None
+        if rank is not None:
+            place, best_score = rank
+            text += f"\nВаше место: {place} из {len(board)} (лучший результат: {best_score})."
+        await sender.send_message(chat_id, text)
         await state.finish()
 
+    # Квиз для /leaderboard и /myrank: из аргумента команды или текущий активный
+    async def resolve_quiz_id(message: types.Message):
+        args = message.get_args()
+        if args and args.strip().isdigit():
+            return int(args.strip())
+        active = await quiz_catalog.active()
+        return active[0].quiz_id if active else None
+
+    # Таблица лидеров
+    @dp.message_handler(commands=['leaderboard'])
+    async def leaderboard_handler(message: types.Message):
+        quiz_id = await resolve_quiz_id(message)
+        if quiz_id is None:
+            await sender.reply(message, "Укажите номер квиза, например: /leaderboard 1")
+            return
+        board = await leaderboards.get(quiz_id)
+        if board is None:
+            await sender.reply(message, f"Квиз {quiz_id} не найден.")
+            return
+        top = board.top(LEADERBOARD_SIZE)
+        if not top:
+            await sender.reply(message, "В этом квизе пока нет результатов.")
+            return
+        lines = [f"{place}. {name or user_id} — {score}" for place, user_id, name, score in top]
+        await sender.reply(message, f"Таблица лидеров квиза {quiz_id}:\n" + "\n".join(lines))
+
+    # Место пользователя
+    @dp.message_handler(commands=['myrank'])
+    async def myrank_handler(message: types.Message):
+        quiz_id = await resolve_quiz_id(message)
+        if quiz_id is None:
+            await sender.reply(message, "Укажите номер квиза, например: /myrank 1")
+            return
+        board = await leaderboards.get(quiz_id)
+        if board is None:
+            await sender.reply(message, f"Квиз {quiz_id} не найден.")
+            return
+        rank = board.rank(message.from_user.id)
+        if rank is None:
+            await sender.reply(message, "Вы еще не проходили этот квиз.")
+            return
+        place, best_score = rank
+        await sender.reply(message, f"Ваше место: {place} из {len(board)} (лучший результат: {best_score}).")
+
+    # Сложность вопросов: доля правильных ответов, частые ответы, распределение баллов
+    @dp.message_handler(commands=['quiz_stats'])
+    async def quiz_stats_handler(message: types.Message):
+        if not await is_admin(message.from_user.username):
+            await sender.reply(message, "У вас нет прав для выполнения этой команды.")
+            return
+        if np is None:
+            await sender.reply(message, "Для этой команды нужен NumPy: pip install numpy")
+            return
+        args = message.get_args()
+        if not args or not args.strip().isdigit():
+            await sender.reply(message, "Использование: /quiz_stats <номер квиза>")
+            return
+        stats = await quiz_stats.get(int(args.strip()))
+        if stats is None:
+            await sender.reply(message, "Квиз не найден.")
+            return
+        if not stats.responses:
+            await sender.reply(message, "По этому квизу еще нет ответов.")
+            return
+        lines = [f"Квиз {stats.quiz_id}: ответов {stats.responses}, завершенных попыток {stats.finished_attempts}", ""]
+        lines.append("Самые сложные вопросы:")
+        hardest = sorted((q for q in stats.questions if q.responses), key=lambda q: q.correct_rate)
+        for question in hardest[:STATS_QUESTIONS_SHOWN]:
+            lines.append(f"{question.correct_rate:.0%} верно ({question.responses}) — {question.text[:60]}")
+            for text, count, correct in question.top_answers:
+                lines.append(f"    {'✓' if correct else '✗'} {text[:30] or '(пусто)'} — {count}")
+        lines.append("")
+        lines.append("Баллы (правильных ответов: попыток):")
+        peak = max(stats.score_histogram) or 1
+        for score, count in enumerate(stats.score_histogram):
+            if count:
+                lines.append(f"{score:>3}: {'█' * max(1, count * 20 // peak)} {count}")
+        await sender.reply(message, "\n".join(lines)[:4096])
+
+    # Резервная копия базы по запросу администратора
+    @dp.message_handler(commands=['backup'])
+    async def backup_handler(message: types.Message):
+        if not await is_admin(message.from_user.username):
+            await sender.reply(message, "У вас нет прав для выполнения этой команды.")
+            return
+        if backup_manager.stats()['running']:
+            await sender.reply(message, "Резервная копия уже создается.")
+            return
+        await sender.reply(message, "Создаю резервную копию, бот продолжает работать...")
+        try:
+            result = await backup_manager.backup()
+        except Exception as e:
+            logging.exception("Не удалось создать резервную копию базы.")
+            await sender.reply(message, f"Ошибка при создании резервной копии: {e}")
+            return
+        if result is None:
+            await sender.reply(message, "Резервная копия уже создается.")
+            return
+        await sender.reply(
+            message,
+            f"Резервная копия готова: {result['path']}\n"
+            f"{result['size'] // 1024} КБ, {result['pages']} страниц, {result['seconds']:.1f} с"
+        )
+
+    # Личная статистика по всем квизам
+    @dp.message_handler(commands=['mystats'])
+    async def mystats_handler(message: types.Message):
+        stats = await get_user_stats(message.from_user.id)
+        if stats is None or not stats.attempts:
+            await sender.reply(message, "Вы еще не проходили квизы. Напишите /quiz, чтобы начать.")
+            return
+        average = stats.total_score / stats.attempts
+        accuracy = stats.total_score * 100 / stats.total_questions if stats.total_questions else 0
+        await sender.reply(
+            message,
+            f"Пройдено квизов: {stats.attempts}\n"
+            f"Лучший результат: {stats.best_score}\n"
+            f"Средний результат: {average:.1f} (правильных ответов {accuracy:.0f}%)\n"
+            f"Серия: {current_streak(stats, datetime.utcnow().date())} дн. подряд, рекорд {stats.best_streak}"
+        )
+
     # Обработчики для управления администраторами
     @dp.message_handler(commands=['add_admin'])
     async def add_admin_handler(message: types.Message):
         username = message.from_user.username
         if not await is_admin(username):
-            await message.reply("У вас нет прав для выполнения этой команды.")
+            await sender.reply(message, "У вас нет прав для выполнения этой команды.")
             return
         args = message.get_args()
         if not args:
-            await message.reply("Пожалуйста, укажите юзернейм нового администратора после команды, например:\n/add_admin @username")
+            await sender.reply(message, "Пожалуйста, укажите юзернейм нового администратора после команды, например:\n/add_admin @username")
             return
-        new_admin_username = args.strip().lstrip('@').lower()
+        new_admin_username = normalize_username(args.strip())
         async with async_session() as session:
             # Проверяем, есть ли уже такой администратор
             result = await session.execute(
-                Admin.__table__.select().where(Admin.username.ilike(new_admin_username))
+                Admin.__table__.select().where(Admin.username_normalized == new_admin_username)
             )
             existing_admin = result.fetchone()
             if existing_admin:
-                await message.reply(f"Пользователь @{new_admin_username} уже является администратором.")
+                await sender.reply(message, f"Пользователь @{new_admin_username} уже является администратором.")
                 return
-            new_admin = Admin(username=new_admin_username)
+            new_admin = Admin(username=new_admin_username, username_normalized=new_admin_username)
             session.add(new_admin)
             try:
                 await session.commit()
-                await message.reply(f"Пользователь @{new_admin_username} добавлен в список администраторов.")
+                admin_cache.invalidate()
+                await sender.reply(message, f"Пользователь @{new_admin_username} добавлен в список администраторов.")
             except Exception as e:
-                await message.reply(f"Ошибка при добавлении администратора: {e}")
+                await sender.reply(message, f"Ошибка при добавлении администратора: {e}")
 
     @dp.message_handler(commands=['remove_admin'])
     async def remove_admin_handler(message: types.Message):
         username = message.from_user.username
         if not await is_admin(username):
-            await message.reply("У вас нет прав для выполнения этой команды.")
+            await sender.reply(message, "У вас нет прав для выполнения этой команды.")
             return
         args = message.get_args()
         if not args:
-            await message.reply("Пожалуйста, укажите юзернейм администратора для удаления после команды, например:\n/remove_admin @username")
+            await sender.reply(message, "Пожалуйста, укажите юзернейм администратора для удаления после команды, например:\n/remove_admin @username")
             return
-        admin_username = args.strip().lstrip('@').lower()
+        admin_username = normalize_username(args.strip())
         async with async_session() as session:
             result = await session.execute(
-                Admin.__table__.select().where(Admin.username.ilike(admin_username))
+                Admin.__table__.select().where(Admin.username_normalized == admin_username)
             )
             admin = result.fetchone()
             if admin:
                 await session.execute(
-                    Admin.__table__.delete().where(Admin.username.ilike(admin_username))
+                    Admin.__table__.delete().where(Admin.username_normalized == admin_username)
                 )
                 await session.commit()
-                await message.reply(f"Пользователь @{admin_username} удален из списка администраторов.")
+                admin_cache.invalidate()
+                await sender.reply(message, f"Пользователь @{admin_username} удален из списка администраторов.")
             else:
-                await message.reply("Такой администратор не найден.")
+                await sender.reply(message, "Такой администратор не найден.")
 
-    # Обработчик для всех сообщений (для тестирования)
-    @dp.message_handler()
-    async def handle_all_messages(message: types.Message):
-        logging.info(f"Получено сообщение: {message.text}")
-        await message.reply("Бот получил ваше сообщение.")
-
-    # Функция для парсинга данных квиза из сообщения
-    def parse_quiz_data(text):
-        lines = text.strip().split('\n')
-        quiz_info = {}
-        questions = []
-        current_question = None
-        for line in lines:
-            line = line.strip()
-            if line.startswith('Название квиза:'):
-                quiz_info['title'] = line[len('Название квиза:'):].strip()
-            elif line.lower() == 'вопросы:':
-                continue
-            elif line.startswith(tuple(f"{i}." for i in range(1, 101))):
-                if current_question:
-                    questions.append(current_question)
-                current_question = {'text': line[line.find('.') + 1:].strip(), 'answer': ''}
-            elif line.startswith('Ответ:'):
-                if current_question:
-                    current_question['answer'] = line[len('Ответ:'):].strip()
-        if current_question:
-            questions.append(current_question)
-        quiz_info['questions'] = questions
-        return quiz_info
-
-    # Функция для сохранения квиза в базу данных
-    async def save_quiz_to_db(quiz_info):
-        async with async_session() as session:
-            new_quiz = Quiz(
-                title=quiz_info['title'],
-                is_active=False,
-                start_time=datetime.utcnow(),
-                end_time=datetime.utcnow() + timedelta(days=7),
-                question_count=len(quiz_info['questions']),
+    # Выгрузка результатов квиза
+    @dp.message_handler(commands=['export_results'])
+    async def export_results_handler(message: types.Message):
+        username = message.from_user.username
+        if not await is_admin(username):
+            await sender.reply(message, "У вас нет прав для выполнения этой команды.")
+            return
+        args = message.get_args().split()
+        if not args or not args[0].isdigit() or (len(args) > 1 and args[1].lower() not in EXPORT_FORMATS):
+            await sender.reply(message, "Использование: /export_results <номер квиза> [csv|jsonl]")
+            return
+        quiz_id = int(args[0])
+        file_format = args[1].lower() if len(args) > 1 else 'csv'
+        await sender.reply(message, "Готовлю выгрузку, файл придет отдельным сообщением.")
+        # Выгрузка идет в фоне, обработчик не ждет ее окончания
+        task = asyncio.get_event_loop().create_task(
+            send_export(message.chat.id, quiz_id, file_format)
+        )
+        export_tasks.add(task)
+        task.add_done_callback(export_tasks.discard)
+
+    export_tasks = set()
+
+    async def send_export(chat_id, quiz_id, file_format):
+        directory = tempfile.mkdtemp()
+        try:
+            # Ответы из буфера тоже должны попасть в выгрузку
+            await response_writer.flush()
+            path, row_count = await export_results(quiz_id, file_format, directory)
+            await sender.send_document(
+                chat_id,
+                types.InputFile(path),
+                caption=f"Результаты квиза {quiz_id}: {row_count} строк."
             )
-            session.add(new_quiz)
-            await session.commit()
-            for q in quiz_info['questions']:
-                new_question = Question(
-                    quiz_id=new_quiz.quiz_id,
-                    text=q['text']
-                )
-                session.add(new_question)
-                await session.commit()
-                new_answer = Answer(
-                    question_id=new_question.question_id,
-                    text=q['answer']
-                )
-                session.add(new_answer)
-                await session.commit()
-            quiz_info['quiz_id'] = new_quiz.quiz_id
+        except Exception as e:
+            logging.exception("Ошибка при выгрузке результатов.")
+            await sender.send_message(chat_id, f"Ошибка при выгрузке результатов: {e}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    # Статистика работы бота
+    @dp.message_handler(commands=['stats'])
+    async def stats_handler(message: types.Message):
+        username = message.from_user.username
+        if not await is_admin(username):
+            await sender.reply(message, "У вас нет прав для выполнения этой команды.")
+            return
+        cache_stats = quiz_cache.stats()
+        send_stats = sender.stats()
+        await sender.reply(
+            message,
+            f"Кэш квизов: {cache_stats['size']} шт., попаданий: {cache_stats['hits']}, промахов: {cache_stats['misses']}\n"
+            f"Отправка: в очереди {send_stats['queued']}, отправлено {send_stats['sent']}, "
+            f"ошибок {send_stats['failed']}, повторов {send_stats['retries']}, "
+            f"задержка p50 {send_stats['latency_p50'] * 1000:.0f} мс, p99 {send_stats['latency_p99'] * 1000:.0f} мс"
+        )
 
-# Регистрируем обработчики
-register_handlers(dp)
+    # Обработчик остальных сообщений; регистрируется последним
+    @dp.message_handler()
+    async def handle_all_messages(message: types.Message):
+        # Текст не пишем в лог: сюда попадает в том числе спам
+        logging.debug(f"Необработанное сообщение от {message.from_user.id}")
+        await sender.reply(message, "Не понимаю это сообщение. Введите /help для просмотра доступных команд.")
@@ -1,18 +1,88 @@
 # helpers.py
 
-from database import async_session, Admin
+import asyncio
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from database import async_session, Admin, User, Quiz
 import logging
 
+# Как часто перечитывать список администраторов из БД (секунды)
+ADMIN_CACHE_TTL = 60
+
+
+def normalize_username(username):
+    return username.lstrip('@').lower()
+
+
+class AdminCache:
+    # Множество нормализованных юзернеймов администраторов
+    def __init__(self, ttl=ADMIN_CACHE_TTL):
+        self.ttl = ttl
+        self._usernames = frozenset()
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def contains(self, normalized_username):
+        if time.monotonic() >= self._expires_at:
+            await self.refresh()
+        return normalized_username in self._usernames
+
+    async def refresh(self):
+        async with self._lock:
+            # Пока ждали блокировку, список мог обновить другой обработчик
+            if time.monotonic() < self._expires_at:
+                return
+            async with async_session() as session:
+                result = await session.execute(select(Admin.username_normalized))
+                self._usernames = frozenset(
+                    row.username_normalized for row in result.fetchall()
+                )
+            self._expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+
+admin_cache = AdminCache()
+
+
 async def is_admin(username):
     if not username:
         logging.info("Пользователь без юзернейма.")
         return False
-    normalized_username = username.lstrip('@').lower()
+    normalized_username = normalize_username(username)
+    is_admin = await admin_cache.contains(normalized_username)
+    logging.debug(f"Проверка администратора '{normalized_username}': {is_admin}")
+    return is_admin
+
+# Приведение ответа к виду, в котором он сравнивается
+def normalize_answer(text):
+    return text.strip().lower()
+
+# Имя пользователя для показа в таблицах
+def display_name(user):
+    return f"@{user.username}" if user.username else user.full_name
+
+# Запоминаем пользователя, чтобы ему можно было отправлять объявления
+async def register_user(user):
+    statement = insert(User.__table__).values(telegram_id=user.id, username=user.username)
     async with async_session() as session:
-        result = await session.execute(
-            Admin.__table__.select().where(Admin.username.ilike(normalized_username))
+        await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=['telegram_id'],
+                set_={'username': statement.excluded.username},
+                # Известного пользователя с тем же именем не переписываем: /start и /quiz без записи
+                where=User.username.is_distinct_from(statement.excluded.username),
+            )
         )
-        admin = result.fetchone()
-        is_admin = admin is not None
-        logging.info(f"Проверка администратора '{normalized_username}': {is_admin}")
-        return is_admin
+        await session.commit()
+
+
+# Квиз еще есть в базе (его могли удалить, пока игрок отвечал)
+async def quiz_exists(quiz_id):
+    async with async_session() as session:
+        result = await session.execute(select(Quiz.quiz_id).where(Quiz.quiz_id == quiz_id))
+        return result.scalar() is not None
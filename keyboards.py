@@ -2,6 +2,8 @@
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from callbacks import callback_data
+
 # Клавиатура для администратора
 def admin_main_menu():
     keyboard = InlineKeyboardMarkup(row_width=2)
@@ -15,23 +17,44 @@ def admin_main_menu():
     )
     return keyboard
 
-# Клавиатура для подтверждения действий
-def confirm_keyboard(action):
-    keyboard = InlineKeyboardMarkup(row_width=2)
+# Клавиатура подтверждения удаления квиза
+def delete_keyboard(quiz_id):
+    keyboard = InlineKeyboardMarkup(row_width=1)
     keyboard.add(
-        InlineKeyboardButton("Да", callback_data=f"confirm_{action}"),
-        InlineKeyboardButton("Нет", callback_data="confirm_cancel"),
+        InlineKeyboardButton("Удалить", callback_data=callback_data('delete_confirm', quiz_id)),
+        InlineKeyboardButton("Сохранить в архив и удалить", callback_data=callback_data('archive_confirm', quiz_id)),
+        InlineKeyboardButton("Отмена", callback_data=callback_data('cancel')),
     )
     return keyboard
 
-# Клавиатура для списка квизов
-def quiz_list_keyboard(quizzes, action):
+# Клавиатура для страницы списка квизов (QuizPage) с кнопками "назад" и "далее"
+def quiz_list_keyboard(page, action):
     keyboard = InlineKeyboardMarkup(row_width=1)
-    for quiz in quizzes:
+    for quiz in page.quizzes:
         keyboard.add(
             InlineKeyboardButton(
                 f"{quiz.title} (ID: {quiz.quiz_id})",
-                callback_data=f"{action}_{quiz.quiz_id}"
+                callback_data=callback_data(action, quiz.quiz_id)
             )
         )
+    navigation = []
+    if page.prev_cursor is not None:
+        navigation.append(InlineKeyboardButton(
+            "← Назад", callback_data=callback_data(f"{action}_page", f"<{page.prev_cursor}")
+        ))
+    if page.next_cursor is not None:
+        navigation.append(InlineKeyboardButton(
+            "Далее →", callback_data=callback_data(f"{action}_page", f">{page.next_cursor}")
+        ))
+    if navigation:
+        keyboard.row(*navigation)
+    return keyboard
+
+# Клавиатура с предложением разослать объявление о квизе
+def broadcast_keyboard(quiz_id):
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        InlineKeyboardButton("Разослать", callback_data=callback_data('broadcast', quiz_id)),
+        InlineKeyboardButton("Не нужно", callback_data=callback_data('cancel')),
+    )
     return keyboard
@@ -0,0 +1,219 @@
+# leaderboard.py
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select, bindparam
+from sqlalchemy.dialects.sqlite import insert
+
+from database import async_session, LeaderboardEntry, Quiz, UserAttempt
+from config import WINNER_PLACES, WORKER_PROCESSES, LEADERBOARD_RELOAD_INTERVAL, LEADERBOARD_CACHE_SIZE
+
+
+class FenwickTree:
+    # Количество пользователей по каждому баллу; префиксные суммы за O(log n)
+    def __init__(self, size):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        index += 1
+        while index <= self.size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        # Сумма по баллам 0..index включительно
+        total = 0
+        index = min(index + 1, self.size)
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+
+class Leaderboard:
+    # Лучшие результаты пользователей одного квиза.
+    # Одинаковый балл - одинаковое место; в топе раньше идет тот, кто набрал его раньше.
+    def __init__(self, quiz_id, max_score):
+        self.quiz_id = quiz_id
+        self._best = {}  # user_id -> (score, name)
+        self._by_score = {}  # score -> {user_id: None} в порядке достижения
+        self._counts = FenwickTree(max_score + 1)
+
+    def __len__(self):
+        return len(self._best)
+
+    def _grow(self, score):
+        # Квиз мог пополниться вопросами: пересобираем дерево под новый максимум
+        counts = FenwickTree(max(score + 1, self._counts.size * 2))
+        for bucket_score, users in self._by_score.items():
+            counts.add(bucket_score, len(users))
+        self._counts = counts
+
+    def update(self, user_id, name, score):
+        # Возвращает True, если это новый лучший результат пользователя
+        current = self._best.get(user_id)
+        if current is not None and current[0] >= score:
+            return False
+        if score >= self._counts.size:
+            self._grow(score)
+        if current is not None:
+            old_bucket = self._by_score[current[0]]
+            del old_bucket[user_id]
+            if not old_bucket:
+                del self._by_score[current[0]]
+            self._counts.add(current[0], -1)
+        self._best[user_id] = (score, name)
+        self._by_score.setdefault(score, {})[user_id] = None
+        self._counts.add(score, 1)
+        return True
+
+    def rank(self, user_id):
+        # (место, балл) или None, если пользователь еще не играл
+        current = self._best.get(user_id)
+        if current is None:
+            return None
+        higher = len(self._best) - self._counts.prefix(current[0])
+        return higher + 1, current[0]
+
+    def top(self, limit):
+        # [(место, user_id, имя, балл)]
+        result = []
+        higher = 0
+        for score in sorted(self._by_score, reverse=True):
+            users = self._by_score[score]
+            for user_id in users:
+                if len(result) >= limit:
+                    return result
+                result.append((higher + 1, user_id, self._best[user_id][1], score))
+            higher += len(users)
+        return result
+
+    def winners(self, places):
+        # Все пользователи с местом не ниже places и ненулевым баллом
+        result = []
+        higher = 0
+        for score in sorted(self._by_score, reverse=True):
+            if higher + 1 > places or score <= 0:
+                break
+            users = self._by_score[score]
+            result.extend((user_id, score) for user_id in users)
+            higher += len(users)
+        return result
+
+
+class LeaderboardRegistry:
+    # Лидерборды квизов в памяти; таблица leaderboard - их постоянная копия,
+    # поэтому давно не запрошенный лидерборд можно вытеснить (LRU) и потом
+    # загрузить заново. Номер квиза приходит от пользователей (/leaderboard <n>),
+    # поэтому для несуществующих квизов ничего не запоминается.
+    def __init__(self, reload_interval=None, max_boards=LEADERBOARD_CACHE_SIZE):
+        self.reload_interval = reload_interval
+        self.max_boards = max_boards
+        self._boards = OrderedDict()  # quiz_id -> (Leaderboard, время загрузки)
+        self._locks = {}
+
+    async def get(self, quiz_id):
+        # None - такого квиза нет
+        entry = self._boards.get(quiz_id)
+        if entry is not None and not self._expired(entry[1]):
+            self._boards.move_to_end(quiz_id)
+            return entry[0]
+        lock = self._locks.setdefault(quiz_id, asyncio.Lock())
+        async with lock:
+            entry = self._boards.get(quiz_id)
+            if entry is None or self._expired(entry[1]):
+                board = await self._load(quiz_id)
+                if board is None:
+                    self._boards.pop(quiz_id, None)
+                    entry = (None, 0.0)
+                else:
+                    entry = self._boards[quiz_id] = (board, time.monotonic())
+                    self._boards.move_to_end(quiz_id)
+                    if len(self._boards) > self.max_boards:
+                        self._boards.popitem(last=False)
+        self._locks.pop(quiz_id, None)
+        return entry[0]
+
+    def invalidate(self, quiz_id):
+        self._boards.pop(quiz_id, None)
+
+    async def record(self, quiz_id, user_id, name, score, achieved_at):
+        board = await self.get(quiz_id)
+        if board is None or not board.update(user_id, name, score):
+            return
+        async with async_session() as session:
+            statement = insert(LeaderboardEntry.__table__).values(
+                quiz_id=quiz_id,
+                user_id=user_id,
+                username=name,
+                best_score=score,
+                achieved_at=achieved_at,
+            )
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=['quiz_id', 'user_id'],
+                    set_={
+                        'username': statement.excluded.username,
+                        'best_score': statement.excluded.best_score,
+                        'achieved_at': statement.excluded.achieved_at,
+                    },
+                    where=LeaderboardEntry.best_score < statement.excluded.best_score,
+                )
+            )
+            await session.commit()
+
+    async def mark_winners(self, quiz_id, places=WINNER_PLACES):
+        # Перечитываем таблицу, чтобы учесть результаты из других процессов
+        self.invalidate(quiz_id)
+        board = await self.get(quiz_id)
+        winners = board.winners(places) if board is not None else []
+        async with async_session() as session:
+            await session.execute(
+                UserAttempt.__table__.update()
+                .where(UserAttempt.quiz_id == quiz_id)
+                .values(is_winner=False)
+            )
+            if winners:
+                await session.execute(
+                    UserAttempt.__table__.update()
+                    .where(
+                        UserAttempt.quiz_id == quiz_id,
+                        UserAttempt.user_id == bindparam('winner_id'),
+                        UserAttempt.correct_answers == bindparam('winner_score'),
+                    )
+                    .values(is_winner=True),
+                    [{'winner_id': user_id, 'winner_score': score} for user_id, score in winners],
+                )
+            await session.commit()
+        return winners
+
+    def _expired(self, loaded_at):
+        return self.reload_interval is not None and time.monotonic() - loaded_at > self.reload_interval
+
+    async def _load(self, quiz_id):
+        async with async_session() as session:
+            result = await session.execute(
+                select(Quiz.question_count).where(Quiz.quiz_id == quiz_id)
+            )
+            max_score = result.scalar()
+            if max_score is None:
+                return None
+            result = await session.execute(
+                select(LeaderboardEntry.user_id, LeaderboardEntry.username, LeaderboardEntry.best_score)
+                .where(LeaderboardEntry.quiz_id == quiz_id)
+                .order_by(LeaderboardEntry.achieved_at)
+            )
+            board = Leaderboard(quiz_id, max_score)
+            for row in result:
+                board.update(row.user_id, row.username, row.best_score)
+        return board
+
+
+# В одном процессе лидерборд всегда актуален; с несколькими процессами
+# каждый видит чужие результаты с задержкой не больше интервала перезагрузки
+leaderboards = LeaderboardRegistry(
+    reload_interval=LEADERBOARD_RELOAD_INTERVAL if WORKER_PROCESSES > 1 else None
+)
@@ -0,0 +1,121 @@
+# logging_setup.py
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_LEVEL, LOG_FILE, LOG_QUEUE_SIZE, LOG_SAMPLE_LIMIT
+
+# Счетчики для метрик: сколько записей отброшено и почему
+log_counters = {'dropped': 0, 'sampled': 0}
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись - одна строка JSON; форматируется в потоке записи, не в цикле событий
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'module': record.module,
+            'line': record.lineno,
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    # Не больше limit записей в секунду с одного места в коде ниже WARNING.
+    # Сообщения собираются f-строками, поэтому ключ - файл и строка вызова.
+    # Число пропущенных записей попадает в следующую пропущенную фильтром.
+    def __init__(self, limit=LOG_SAMPLE_LIMIT):
+        super().__init__()
+        self.limit = limit
+        self._windows = {}  # (путь, строка) -> [начало секунды, записано, пропущено]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.limit:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= 1.0:
+            suppressed = window[2] if window is not None else 0
+            self._windows[key] = [now, 1, 0]
+            record.suppressed = suppressed
+            return True
+        if window[1] < self.limit:
+            window[1] += 1
+            return True
+        window[2] += 1
+        log_counters['sampled'] += 1
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Кладет запись в ограниченную очередь и сразу возвращается;
+    # если поток записи не успевает, запись отбрасывается и учитывается
+    def prepare(self, record):
+        # Форматирование целиком - в потоке записи; здесь только то, что
+        # нельзя отложить: подстановка аргументов и текст исключения
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_counters['dropped'] += 1
+
+
+def log_stats():
+    return dict(log_counters, queued=_queue.qsize() if _queue is not None else 0)
+
+
+_queue = None
+_listener = None
+_lock = threading.Lock()
+
+
+def setup_logging(level=LOG_LEVEL, path=LOG_FILE, queue_size=LOG_QUEUE_SIZE):
+    global _queue, _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        _queue = queue.Queue(maxsize=queue_size)
+        if path:
+            output = logging.FileHandler(path, encoding='utf-8')
+        else:
+            output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter())
+
+        handler = DroppingQueueHandler(_queue)
+        handler.addFilter(SamplingFilter())
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(_queue, output, respect_handler_level=True)
+        _listener.start()
+        # Дописываем очередь при выходе из процесса
+        atexit.register(_listener.stop)
+        return _listener
@@ -0,0 +1,162 @@
+# matching.py
+
+import re
+import unicodedata
+
+from config import FUZZY_MAX_DISTANCE
+
+# Разделитель вариантов правильного ответа: "Париж | Paris"
+VARIANT_SEPARATOR = '|'
+
+# При большем числе вариантов с опечатками вместо перебора строится индекс удалений
+SCAN_LIMIT = 8
+
+_SPACES = re.compile(r'\s+')
+
+# Знаки перед цифрой остаются, иначе "-5" совпадет с "5", а "3.14" с "3 14".
+# Тире и минус приводятся к дефису, десятичная запятая - к точке.
+_NUMBER_MARKS = {'-': '-', '\u2010': '-', '\u2012': '-', '\u2013': '-', '\u2212': '-', '.': '.', ',': '.'}
+
+
+# Нормализация для сравнения: Unicode NFKC, регистр, ё -> е, без пунктуации
+def normalize_for_match(text):
+    text = unicodedata.normalize('NFKC', text).casefold().replace('ё', 'е')
+    chars = []
+    last = len(text) - 1
+    for i, char in enumerate(text):
+        if char in _NUMBER_MARKS and i < last and text[i + 1].isdigit():
+            chars.append(_NUMBER_MARKS[char])
+        elif unicodedata.category(char).startswith('P'):
+            chars.append(' ')
+        else:
+            chars.append(char)
+    return _SPACES.sub(' ', ''.join(chars)).strip()
+
+
+def split_variants(text):
+    return [variant for variant in text.split(VARIANT_SEPARATOR) if variant.strip()]
+
+
+# Допустимое число опечаток зависит от длины ответа: короткие и числа - только точно
+def allowed_distance(length, max_distance=FUZZY_MAX_DISTANCE, numeric=False):
+    if numeric or length <= 3:
+        return 0
+    if length <= 7:
+        return min(1, max_distance)
+    return max_distance
+
+
+# Расстояние Левенштейна в полосе ширины limit; если оно больше limit,
+# возвращается limit + 1, как только это становится ясно
+def bounded_levenshtein(a, b, limit):
+    if a == b:
+        return 0
+    too_far = limit + 1
+    len_a = len(a)
+    len_b = len(b)
+    if abs(len_a - len_b) > limit:
+        return too_far
+    if len_a > len_b:
+        a, b, len_a, len_b = b, a, len_b, len_a
+    previous = [j if j <= limit else too_far for j in range(len_b + 1)]
+    for i in range(1, len_a + 1):
+        char_a = a[i - 1]
+        current = [too_far] * (len_b + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len_b, i + limit) + 1):
+            value = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if value > too_far:
+                value = too_far
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return too_far
+        previous = current
+    return previous[len_b]
+
+
+# Все строки, получаемые из word удалением не более depth символов
+def deletions(word, depth):
+    result = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {item[:i] + item[i + 1:] for item in frontier for i in range(len(item))}
+        result |= frontier
+    return result
+
+
+class AnswerMatcher:
+    # Проверка ответа на один вопрос; собирается один раз при загрузке квиза.
+    # Вариантов с опечатками немного - перебор по длине; много - индекс
+    # симметричных удалений: если расстояние не больше d, то у ответа и варианта
+    # есть общая строка, полученная не более чем d удалениями из каждого.
+    __slots__ = ('_exact', '_by_length', '_deletions', '_max_distance', '_max_length')
+
+    def __init__(self, variants, max_distance=FUZZY_MAX_DISTANCE):
+        self._exact = set()
+        self._by_length = {}
+        self._deletions = None
+        self._max_distance = 0
+        self._max_length = 0
+        fuzzy = []
+        for variant in variants:
+            normalized = normalize_for_match(variant)
+            if not normalized or normalized in self._exact:
+                continue
+            self._exact.add(normalized)
+            numeric = any(char.isdigit() for char in normalized)
+            distance = allowed_distance(len(normalized), max_distance, numeric)
+            if distance:
+                fuzzy.append((normalized, distance))
+                self._max_distance = max(self._max_distance, distance)
+                self._max_length = max(self._max_length, len(normalized))
+        if len(fuzzy) > SCAN_LIMIT:
+            self._deletions = {}
+            for normalized, distance in fuzzy:
+                for key in deletions(normalized, distance):
+                    self._deletions.setdefault(key, []).append((normalized, distance))
+        else:
+            for normalized, distance in fuzzy:
+                self._by_length.setdefault(len(normalized), []).append((normalized, distance))
+
+    def __bool__(self):
+        return bool(self._exact)
+
+    def match(self, text):
+        normalized = normalize_for_match(text)
+        if normalized in self._exact:
+            return True
+        # Ответ длиннее любого варианта с запасом на опечатки не совпадет ни с одним;
+        # кроме того, число удалений растет с длиной строки как степень max_distance
+        if len(normalized) > self._max_length + self._max_distance:
+            return False
+        if self._deletions is not None:
+            return self._match_indexed(normalized)
+        if not self._by_length:
+            return False
+        length = len(normalized)
+        # Смотрим только варианты, длина которых отличается не больше чем на порог
+        for candidate_length in range(length - self._max_distance, length + self._max_distance + 1):
+            for variant, distance in self._by_length.get(candidate_length, ()):
+                if abs(candidate_length - length) <= distance and \
+                        bounded_levenshtein(normalized, variant, distance) <= distance:
+                    return True
+        return False
+
+    def _match_indexed(self, normalized):
+        checked = set()
+        for key in deletions(normalized, self._max_distance):
+            for variant, distance in self._deletions.get(key, ()):
+                if variant in checked:
+                    continue
+                checked.add(variant)
+                if bounded_levenshtein(normalized, variant, distance) <= distance:
+                    return True
+        return False
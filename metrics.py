@@ -0,0 +1,221 @@
+# metrics.py
+
+import functools
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+from aiogram import Dispatcher
+from aiogram.dispatcher.handler import CancelHandler, SkipHandler
+from sqlalchemy import event
+
+from config import METRICS_HOST, METRICS_PORT
+
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # значения меток -> [счетчики корзин..., сумма, количество]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, label_values, ('le', le))} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    # Значение считывается функцией в момент запроса метрик
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            f"{self.name} {self.function()}",
+        ]
+
+
+class CallbackCounter(Gauge):
+    # Накопительный счетчик компонента (stats()), считывается так же в момент запроса.
+    # Тип counter, чтобы rate()/increase() учитывали сброс при перезапуске
+    kind = 'counter'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function):
+        return self.register(Gauge(name, documentation, function))
+
+    def callback_counter(self, name, documentation, function):
+        return self.register(CallbackCounter(name, documentation, function))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+handler_latency = registry.histogram(
+    'quiz_handler_latency_seconds', "Время выполнения обработчиков", ('handler',)
+)
+handler_errors = registry.counter(
+    'quiz_handler_errors_total', "Исключения в обработчиках", ('handler',)
+)
+db_query_latency = registry.histogram(
+    'quiz_db_query_latency_seconds', "Время выполнения SQL-запросов", ('statement',)
+)
+
+
+# --- Обработчики aiogram ---
+
+def instrument_handler(handler):
+    if getattr(handler, '__instrumented__', False):
+        return handler
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except (CancelHandler, SkipHandler):
+            raise
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def instrument_handlers(dp: Dispatcher):
+    # aiogram разбирает сигнатуру при регистрации, поэтому подменяем только
+    # вызываемую функцию, а разобранная спецификация остается от оригинала
+    for handlers in (
+        dp.message_handlers,
+        dp.edited_message_handlers,
+        dp.callback_query_handlers,
+        dp.errors_handlers,
+    ):
+        for handler_obj in handlers.handlers:
+            handler_obj.handler = instrument_handler(handler_obj.handler)
+
+
+# --- SQLAlchemy ---
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+    # У Engine нет словаря info (он есть только у соединений), отмечаем атрибутом
+    if getattr(sync_engine, 'quiz_instrumented', False):
+        return
+    sync_engine.quiz_instrumented = True
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        # Метка - только вид запроса, чтобы число рядов метрики не росло
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        db_query_latency.observe(time.perf_counter() - started, verb)
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(exception_context):
+        # after_cursor_execute не вызывается при ошибке: убираем отметку времени
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_started'):
+            conn.info['query_started'].pop()
+
+
+# --- HTTP ---
+
+async def handle_metrics(request):
+    return web.Response(
+        text=registry.render(),
+        content_type='text/plain',
+        headers={'X-Content-Type-Options': 'nosniff'},
+    )
+
+
+async def start_metrics_server(port_offset=0):
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, METRICS_HOST, METRICS_PORT + port_offset)
+    await site.start()
+    return runner
@@ -0,0 +1,102 @@
+# middleware.py
+
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from sender import sender, TokenBucket
+from config import (
+    THROTTLE_RATE,
+    THROTTLE_BURST,
+    THROTTLE_MAX_USERS,
+    REPEAT_WINDOW,
+    DEDUP_WINDOW,
+)
+
+
+class UserState:
+    # Что помним о пользователе: бакет запросов, последний текст и предупреждение
+    __slots__ = ('bucket', 'last_text', 'last_text_at', 'warned')
+
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.last_text = None
+        self.last_text_at = 0.0
+        self.warned = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    # Срабатывает на уровне обновления - до фильтров, состояния FSM и любых
+    # запросов к БД. Отбрасывает повторно доставленные update_id, повторные
+    # нажатия (тот же текст подряд за REPEAT_WINDOW секунд) и сообщения сверх
+    # лимита THROTTLE_RATE в секунду на пользователя.
+    def __init__(self, rate=THROTTLE_RATE, burst=THROTTLE_BURST, max_users=THROTTLE_MAX_USERS,
+                 repeat_window=REPEAT_WINDOW, dedup_window=DEDUP_WINDOW):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.repeat_window = repeat_window
+        self.dedup_window = dedup_window
+        self._users = OrderedDict()
+        self._seen_updates = OrderedDict()
+        self.dropped = {'duplicate': 0, 'repeat': 0, 'throttled': 0}
+
+    def stats(self):
+        return dict(self.dropped, users=len(self._users))
+
+    def _user(self, user_id):
+        # LRU: давно молчавший пользователь и так получил бы полный бакет
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = UserState(self.rate, self.burst)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def _is_duplicate(self, update_id):
+        if update_id in self._seen_updates:
+            return True
+        self._seen_updates[update_id] = None
+        if len(self._seen_updates) > self.dedup_window:
+            self._seen_updates.popitem(last=False)
+        return False
+
+    def _drop(self, reason):
+        self.dropped[reason] += 1
+        raise CancelHandler()
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        if self._is_duplicate(update.update_id):
+            self._drop('duplicate')
+        event = update.message or update.callback_query
+        if event is None or event.from_user is None:
+            return
+        state = self._user(event.from_user.id)
+        now = time.monotonic()
+
+        if update.message is not None and update.message.text:
+            text = update.message.text
+            if text == state.last_text and now - state.last_text_at < self.repeat_window:
+                self._drop('repeat')
+            state.last_text = text
+            state.last_text_at = now
+
+        if state.bucket.take(now):
+            state.warned = False
+            return
+        # Предупреждаем один раз за серию, чтобы не отвечать на каждое сообщение
+        if not state.warned:
+            state.warned = True
+            logging.info(f"Пользователь {event.from_user.id} превысил лимит сообщений.")
+            if update.message is not None:
+                await sender.reply(update.message, "Слишком много сообщений, подождите несколько секунд.")
+            else:
+                await sender.answer_callback(update.callback_query, "Слишком часто, подождите.")
+        self._drop('throttled')
@@ -0,0 +1,98 @@
+# quiz_cache.py
+
+import asyncio
+import time
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from config import QUIZ_CACHE_TTL
+from database import async_session, Quiz, Question, Answer
+from matching import AnswerMatcher, split_variants
+
+# Вопрос в "скомпилированном" виде: варианты ответа собраны в AnswerMatcher
+CompiledQuestion = namedtuple('CompiledQuestion', ['question_id', 'text', 'matcher'])
+CompiledQuiz = namedtuple('CompiledQuiz', ['quiz_id', 'questions', 'time_limit', 'exam'])
+
+
+class QuizCache:
+    # Кэш квизов на весь процесс: quiz_id -> (CompiledQuiz, срок годности)
+    def __init__(self, ttl=QUIZ_CACHE_TTL):
+        self.ttl = ttl
+        self._quizzes = {}
+        self._locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, quiz_id):
+        compiled = self._cached(quiz_id)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+        # Один запрос к БД на квиз, даже если его ждут тысячи игроков
+        lock = self._locks.setdefault(quiz_id, asyncio.Lock())
+        async with lock:
+            compiled = self._cached(quiz_id)
+            if compiled is not None:
+                self.hits += 1
+                return compiled
+            self.misses += 1
+            compiled = await self._load(quiz_id)
+            if compiled is not None:
+                # TTL нужен процессам-обработчикам, которые не видят invalidate() соседей:
+                # удаленный квиз перестает приниматься и там
+                self._quizzes[quiz_id] = (compiled, time.monotonic() + self.ttl)
+            else:
+                self._quizzes.pop(quiz_id, None)
+        self._locks.pop(quiz_id, None)
+        return compiled
+
+    def _cached(self, quiz_id):
+        entry = self._quizzes.get(quiz_id)
+        if entry is None or time.monotonic() >= entry[1]:
+            return None
+        return entry[0]
+
+    def invalidate(self, quiz_id=None):
+        if quiz_id is None:
+            self._quizzes.clear()
+        else:
+            self._quizzes.pop(quiz_id, None)
+
+    def stats(self):
+        return {
+            'size': len(self._quizzes),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    async def _load(self, quiz_id):
+        async with async_session() as session:
+            result = await session.execute(
+                select(Question.question_id, Question.text, Answer.text.label('answer'))
+                .outerjoin(Answer, Answer.question_id == Question.question_id)
+                .where(Question.quiz_id == quiz_id)
+                .order_by(Question.question_id, Answer.answer_id)
+            )
+            rows = result.fetchall()
+            result = await session.execute(
+                select(Quiz.question_time_limit, Quiz.is_exam).where(Quiz.quiz_id == quiz_id)
+            )
+            settings = result.fetchone()
+        if not rows or settings is None:
+            return None
+        # Все строки answers вопроса и все варианты через '|' считаются правильными
+        texts = {}
+        variants = {}
+        for row in rows:
+            texts.setdefault(row.question_id, row.text)
+            if row.answer is not None:
+                variants.setdefault(row.question_id, []).extend(split_variants(row.answer))
+        questions = []
+        for question_id, text in texts.items():
+            matcher = AnswerMatcher(variants.get(question_id, ()))
+            questions.append(CompiledQuestion(question_id, text, matcher or None))
+        return CompiledQuiz(quiz_id, tuple(questions), settings.question_time_limit, bool(settings.is_exam))
+
+
+quiz_cache = QuizCache()
@@ -0,0 +1,116 @@
+# quiz_catalog.py
+
+import asyncio
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from database import async_session, Quiz
+from config import QUIZ_PAGE_SIZE, QUIZ_CATALOG_TTL
+
+# Страница списка квизов; курсоры - quiz_id для кнопок "назад" и "далее" (None - кнопки нет)
+QuizPage = namedtuple('QuizPage', ['quizzes', 'prev_cursor', 'next_cursor'])
+QuizItem = namedtuple('QuizItem', ['quiz_id', 'title'])
+
+# Какие квизы показывать в списке
+QUIZ_FILTERS = {
+    'active': Quiz.is_active == True,
+    'inactive': Quiz.is_active == False,
+    'all': None,
+}
+
+
+def _make_page(items, has_prev, has_next):
+    return QuizPage(
+        items,
+        items[0].quiz_id if items and has_prev else None,
+        items[-1].quiz_id if items and has_next else None,
+    )
+
+
+class QuizCatalog:
+    # Списки квизов для клавиатур. Страницы выбираются по quiz_id (keyset),
+    # а не через OFFSET, и читаются только id и название. Активных квизов
+    # немного, их список кэшируется: игроки выбирают квиз без запроса к БД.
+    def __init__(self, page_size=QUIZ_PAGE_SIZE, ttl=QUIZ_CATALOG_TTL):
+        self.page_size = page_size
+        self.ttl = ttl
+        self._active = ()
+        self._active_ids = []
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def active(self):
+        if time.monotonic() >= self._expires_at:
+            await self.refresh()
+        return self._active
+
+    async def refresh(self):
+        async with self._lock:
+            if time.monotonic() < self._expires_at:
+                return
+            async with async_session() as session:
+                result = await session.execute(
+                    select(Quiz.quiz_id, Quiz.title)
+                    .where(QUIZ_FILTERS['active'])
+                    .order_by(Quiz.quiz_id)
+                )
+                self._active = tuple(QuizItem(row.quiz_id, row.title) for row in result.fetchall())
+            self._active_ids = [item.quiz_id for item in self._active]
+            # TTL нужен процессам-обработчикам, которые не видят invalidate() соседей
+            self._expires_at = time.monotonic() + self.ttl
+
+    async def is_active(self, quiz_id):
+        await self.active()
+        index = bisect_left(self._active_ids, quiz_id)
+        return index < len(self._active_ids) and self._active_ids[index] == quiz_id
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    # direction '>' - квизы после cursor, '<' - квизы перед ним
+    async def page(self, kind, direction='>', cursor=0):
+        if kind == 'active':
+            page = await self._cached_page(direction, cursor)
+        else:
+            page = await self._query_page(kind, direction, cursor)
+        if not page.quizzes and direction == '<':
+            # Предыдущую страницу успели удалить - показываем первую
+            return await self.page(kind)
+        return page
+
+    async def _cached_page(self, direction, cursor):
+        await self.active()
+        items = self._active
+        if direction == '>':
+            start = bisect_right(self._active_ids, cursor)
+            end = start + self.page_size
+        else:
+            end = bisect_left(self._active_ids, cursor)
+            start = max(0, end - self.page_size)
+        return _make_page(items[start:end], start > 0, end < len(items))
+
+    async def _query_page(self, kind, direction, cursor):
+        query = select(Quiz.quiz_id, Quiz.title).limit(self.page_size + 1)
+        condition = QUIZ_FILTERS[kind]
+        if condition is not None:
+            query = query.where(condition)
+        if direction == '>':
+            query = query.where(Quiz.quiz_id > cursor).order_by(Quiz.quiz_id)
+        else:
+            query = query.where(Quiz.quiz_id < cursor).order_by(Quiz.quiz_id.desc())
+        async with async_session() as session:
+            result = await session.execute(query)
+            rows = [QuizItem(row.quiz_id, row.title) for row in result.fetchall()]
+        # Лишняя строка говорит, что в этом направлении есть еще страница
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if direction == '>':
+            return _make_page(rows, cursor > 0, has_more)
+        rows.reverse()
+        return _make_page(rows, has_more, True)
+
+
+quiz_catalog = QuizCatalog()
@@ -0,0 +1,312 @@
+# quiz_cleanup.py
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import select, func
+
+from database import (
+    async_session,
+    Quiz,
+    Question,
+    Answer,
+    UserAttempt,
+    UserResponse,
+    LeaderboardEntry,
+    Broadcast,
+)
+from export import export_results
+from leaderboard import leaderboards
+from quiz_cache import quiz_cache
+from quiz_catalog import quiz_catalog
+from quiz_import import SCHEDULE_FORMAT
+from quiz_stats import quiz_stats
+from response_writer import response_writer
+from sender import sender
+from config import CLEANUP_CHUNK_SIZE, CLEANUP_PAUSE, ARCHIVE_DIRECTORY
+
+# Как часто обновлять сообщение с прогрессом (секунды)
+PROGRESS_INTERVAL = 2.0
+
+
+class QuizCleaner:
+    # Удаление квиза по частям: каждая порция - отдельная короткая транзакция,
+    # между порциями цикл событий свободен, и SQLite не блокируется надолго.
+    # Строка квиза удаляется последней, поэтому прерванное удаление можно
+    # просто запустить снова.
+    def __init__(self, chunk_size=CLEANUP_CHUNK_SIZE, pause=CLEANUP_PAUSE):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self._tasks = {}
+        self._progress = {}  # quiz_id -> {'stage': ..., 'deleted': ...}
+
+    def start(self, quiz_id, admin_chat_id, archive=False):
+        if quiz_id in self._tasks:
+            return False
+        self._progress[quiz_id] = {'stage': 'подготовка', 'deleted': 0}
+        task = asyncio.get_event_loop().create_task(self._run(quiz_id, admin_chat_id, archive))
+        self._tasks[quiz_id] = task
+        return True
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def progress(self):
+        # [(quiz_id, этап, удалено строк)]
+        return [
+            (quiz_id, progress['stage'], progress['deleted'])
+            for quiz_id, progress in self._progress.items()
+        ]
+
+    def _format_progress(self, quiz_id):
+        progress = self._progress[quiz_id]
+        return f"Удаление квиза {quiz_id}: {progress['stage']}, удалено строк: {progress['deleted']}"
+
+    async def _run(self, quiz_id, admin_chat_id, archive):
+        progress = self._progress[quiz_id]
+        progress_message = None
+        last_report = time.monotonic()
+
+        async def report(stage, deleted):
+            nonlocal last_report
+            progress['stage'] = stage
+            progress['deleted'] += deleted
+            now = time.monotonic()
+            if progress_message is None or now - last_report < PROGRESS_INTERVAL:
+                return
+            last_report = now
+            try:
+                await sender.edit_text(progress_message, self._format_progress(quiz_id))
+            except Exception:
+                logging.exception("Не удалось обновить прогресс удаления.")
+
+        try:
+            progress_message = await sender.send_message(admin_chat_id, self._format_progress(quiz_id))
+            # Новые попытки не начинаются, текущие завершаются при следующем ответе
+            async with async_session() as session:
+                await session.execute(
+                    Quiz.__table__.update().where(Quiz.quiz_id == quiz_id).values(is_active=False)
+                )
+                await session.commit()
+            quiz_cache.invalidate(quiz_id)
+            quiz_catalog.invalidate()
+            leaderboards.invalidate(quiz_id)
+            # Ответы из буфера должны попасть в базу до удаления попыток
+            await response_writer.flush()
+
+            archive_paths = []
+            if archive:
+                await report('архивирование', 0)
+                archive_paths = await self._archive(quiz_id)
+
+            attempt_ids = await self._delete_attempts(quiz_id, report)
+            await self._delete_questions(quiz_id, report)
+            await self._delete_leaderboard(quiz_id, report)
+            async with async_session() as session:
+                result = await session.execute(
+                    Broadcast.__table__.delete().where(Broadcast.quiz_id == quiz_id)
+                )
+                deleted = result.rowcount
+                await session.execute(Quiz.__table__.delete().where(Quiz.quiz_id == quiz_id))
+                await session.commit()
+            await report('рассылки и квиз', deleted + 1)
+
+            # Игроки, которые были посреди квиза, могли дописать ответы, попытки
+            # и места в таблице, пока шло удаление. Квиза уже нет, и новые
+            # результаты не записываются (announce_result проверяет квиз),
+            # поэтому второй проход убирает все, что осталось.
+            await response_writer.flush()
+            attempt_ids += await self._delete_attempts(quiz_id, report)
+            await self._delete_responses(attempt_ids, report)
+            await self._delete_leaderboard(quiz_id, report)
+            await report('готово', 0)
+            quiz_cache.invalidate(quiz_id)
+            quiz_stats.invalidate(quiz_id)
+            quiz_catalog.invalidate()
+            leaderboards.invalidate(quiz_id)
+
+            text = f"Квиз {quiz_id} удален, строк: {progress['deleted']}."
+            if archive_paths:
+                text += "\nАрхив: " + ", ".join(archive_paths)
+            await sender.send_message(admin_chat_id, text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f"Удаление квиза {quiz_id} прервано.")
+            await sender.send_message(
+                admin_chat_id, f"Удаление квиза {quiz_id} прервано, запустите его еще раз."
+            )
+        finally:
+            self._tasks.pop(quiz_id, None)
+            self._progress.pop(quiz_id, None)
+
+    async def _delete_attempts(self, quiz_id, report):
+        # Порция попыток подбирается так, чтобы вместе с ответами было около chunk_size строк
+        async with async_session() as session:
+            result = await session.execute(
+                select(func.count()).select_from(Question).where(Question.quiz_id == quiz_id)
+            )
+            question_count = result.scalar() or 1
+        attempts_per_chunk = max(1, self.chunk_size // question_count)
+        last_attempt_id = 0
+        # Номера удаленных попыток: по ним потом ищутся запоздавшие ответы
+        deleted_ids = []
+        while True:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(UserAttempt.attempt_id)
+                    .where(UserAttempt.quiz_id == quiz_id, UserAttempt.attempt_id > last_attempt_id)
+                    .order_by(UserAttempt.attempt_id)
+                    .limit(attempts_per_chunk)
+                )
+                attempt_ids = result.scalars().all()
+                if not attempt_ids:
+                    break
+                responses = await session.execute(
+                    UserResponse.__table__.delete().where(UserResponse.attempt_id.in_(attempt_ids))
+                )
+                attempts = await session.execute(
+                    UserAttempt.__table__.delete().where(UserAttempt.attempt_id.in_(attempt_ids))
+                )
+                await session.commit()
+            last_attempt_id = attempt_ids[-1]
+            deleted_ids.extend(attempt_ids)
+            await report('попытки и ответы игроков', responses.rowcount + attempts.rowcount)
+            await asyncio.sleep(self.pause)
+        return deleted_ids
+
+    async def _delete_responses(self, attempt_ids, report):
+        # Ответы, записанные после удаления своей попытки
+        for start in range(0, len(attempt_ids), self.chunk_size):
+            async with async_session() as session:
+                result = await session.execute(
+                    UserResponse.__table__.delete().where(
+                        UserResponse.attempt_id.in_(attempt_ids[start:start + self.chunk_size])
+                    )
+                )
+                await session.commit()
+            if result.rowcount:
+                await report('запоздавшие ответы игроков', result.rowcount)
+            await asyncio.sleep(self.pause)
+
+    async def _delete_questions(self, quiz_id, report):
+        while True:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(Question.question_id)
+                    .where(Question.quiz_id == quiz_id)
+                    .order_by(Question.question_id)
+                    .limit(self.chunk_size)
+                )
+                question_ids = result.scalars().all()
+                if not question_ids:
+                    break
+                answers = await session.execute(
+                    Answer.__table__.delete().where(Answer.question_id.in_(question_ids))
+                )
+                questions = await session.execute(
+                    Question.__table__.delete().where(Question.question_id.in_(question_ids))
+                )
+                await session.commit()
+            await report('вопросы', answers.rowcount + questions.rowcount)
+            await asyncio.sleep(self.pause)
+
+    async def _delete_leaderboard(self, quiz_id, report):
+        while True:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(LeaderboardEntry.user_id)
+                    .where(LeaderboardEntry.quiz_id == quiz_id)
+                    .limit(self.chunk_size)
+                )
+                user_ids = result.scalars().all()
+                if not user_ids:
+                    break
+                deleted = await session.execute(
+                    LeaderboardEntry.__table__.delete().where(
+                        LeaderboardEntry.quiz_id == quiz_id,
+                        LeaderboardEntry.user_id.in_(user_ids),
+                    )
+                )
+                await session.commit()
+            await report('таблица лидеров', deleted.rowcount)
+            await asyncio.sleep(self.pause)
+
+    async def _archive(self, quiz_id):
+        # Вопросы сохраняются в формате JSON Lines, который понимает импорт квизов,
+        # результаты - так же, как в /export_results
+        os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+        loop = asyncio.get_event_loop()
+        questions_path = os.path.join(ARCHIVE_DIRECTORY, f"quiz_{quiz_id}_questions.jsonl.gz")
+        async with async_session() as session:
+            result = await session.execute(
+                select(
+                    Quiz.title,
+                    Quiz.is_exam,
+                    Quiz.question_time_limit,
+                    Quiz.is_scheduled,
+                    Quiz.start_time,
+                    Quiz.end_time,
+                ).where(Quiz.quiz_id == quiz_id)
+            )
+            quiz = result.fetchone()
+        # Заголовок с настройками квиза - в тех же ключах, что читает импорт
+        header = {'title': quiz.title, 'mode': 'exam' if quiz.is_exam else 'normal'}
+        if quiz.question_time_limit:
+            header['time_limit'] = quiz.question_time_limit
+        if quiz.is_scheduled:
+            if quiz.start_time is not None:
+                header['start'] = quiz.start_time.strftime(SCHEDULE_FORMAT)
+            if quiz.end_time is not None:
+                header['end'] = quiz.end_time.strftime(SCHEDULE_FORMAT)
+        f = await loop.run_in_executor(None, lambda: gzip.open(questions_path, 'wt', encoding='utf-8'))
+        try:
+            await loop.run_in_executor(
+                None, f.write, json.dumps(header, ensure_ascii=False) + '\n'
+            )
+            last_question_id = 0
+            while True:
+                async with async_session() as session:
+                    result = await session.execute(
+                        select(Question.question_id, Question.text, Answer.text.label('answer'))
+                        .outerjoin(Answer, Answer.question_id == Question.question_id)
+                        .where(Question.quiz_id == quiz_id, Question.question_id > last_question_id)
+                        .order_by(Question.question_id, Answer.answer_id)
+                        .limit(self.chunk_size)
+                    )
+                    rows = result.fetchall()
+                if not rows:
+                    break
+                # Неполный последний вопрос порции перечитывается в следующей
+                if len(rows) == self.chunk_size and rows[0].question_id != rows[-1].question_id:
+                    rows = [row for row in rows if row.question_id != rows[-1].question_id]
+                answers = {}
+                texts = {}
+                for row in rows:
+                    texts.setdefault(row.question_id, row.text)
+                    if row.answer is not None:
+                        answers.setdefault(row.question_id, []).append(row.answer)
+                lines = ''.join(
+                    json.dumps(
+                        {'question': text, 'answer': ' | '.join(answers.get(question_id, ()))},
+                        ensure_ascii=False,
+                    ) + '\n'
+                    for question_id, text in texts.items()
+                )
+                await loop.run_in_executor(None, f.write, lines)
+                last_question_id = rows[-1].question_id
+                await asyncio.sleep(self.pause)
+        finally:
+            await loop.run_in_executor(None, f.close)
+        results_path, _ = await export_results(quiz_id, 'jsonl', ARCHIVE_DIRECTORY)
+        return [questions_path, results_path]
+
+
+quiz_cleaner = QuizCleaner()
@@ -0,0 +1,261 @@
+# quiz_import.py
+
+import csv
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import select
+
+from database import async_session, Quiz, Question, Answer
+
+TITLE_PREFIX = 'Название квиза:'
+ANSWER_PREFIX = 'Ответ:'
+TIME_LIMIT_PREFIX = 'Время на вопрос:'
+START_PREFIX = 'Начало:'
+END_PREFIX = 'Конец:'
+MODE_PREFIX = 'Режим:'
+EXAM_MODES = ('экзамен', 'exam')
+# Время начала и окончания квиза - в UTC
+SCHEDULE_FORMAT = '%Y-%m-%d %H:%M'
+QUESTION_RE = re.compile(r'^(\d+)\.\s*(.*)$')
+
+# Сколько вопросов вставлять одной транзакцией при импорте файла
+IMPORT_CHUNK_SIZE = 1000
+
+CSV_HEADERS = {('question', 'answer'), ('вопрос', 'ответ')}
+
+
+# Необязательные настройки квиза: время на вопрос и расписание
+def parse_setting(quiz_info, key, value):
+    value = str(value).strip()
+    if key == 'mode':
+        if value.lower() not in EXAM_MODES + ('обычный', 'normal'):
+            raise ValueError(f"Неизвестный режим квиза: {value!r}.")
+        quiz_info['exam'] = value.lower() in EXAM_MODES
+    elif key == 'time_limit':
+        if not value.isdigit() or int(value) <= 0:
+            raise ValueError(f"Время на вопрос должно быть целым числом секунд: {value!r}.")
+        quiz_info['time_limit'] = int(value)
+    else:
+        try:
+            quiz_info[key] = datetime.strptime(value, SCHEDULE_FORMAT)
+        except ValueError:
+            raise ValueError(f"Неверный формат времени {value!r}, нужен ГГГГ-ММ-ДД ЧЧ:ММ.")
+
+
+# Потоковый разбор текстового формата (как в сообщении /add_quiz)
+def iter_text_questions(lines, quiz_info):
+    current_question = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith(TITLE_PREFIX):
+            quiz_info['title'] = line[len(TITLE_PREFIX):].strip()
+        elif line.startswith(TIME_LIMIT_PREFIX):
+            parse_setting(quiz_info, 'time_limit', line[len(TIME_LIMIT_PREFIX):])
+        elif line.startswith(MODE_PREFIX):
+            parse_setting(quiz_info, 'mode', line[len(MODE_PREFIX):])
+        elif line.startswith(START_PREFIX):
+            parse_setting(quiz_info, 'start_time', line[len(START_PREFIX):])
+        elif line.startswith(END_PREFIX):
+            parse_setting(quiz_info, 'end_time', line[len(END_PREFIX):])
+        elif line.lower() == 'вопросы:':
+            continue
+        elif QUESTION_RE.match(line):
+            if current_question:
+                yield current_question
+            current_question = {'text': QUESTION_RE.match(line).group(2).strip(), 'answer': ''}
+        elif line.startswith(ANSWER_PREFIX):
+            if current_question:
+                current_question['answer'] = line[len(ANSWER_PREFIX):].strip()
+    if current_question:
+        yield current_question
+
+
+# CSV: строки "вопрос,ответ", заголовок необязателен
+def iter_csv_questions(lines, quiz_info):
+    for line_number, row in enumerate(csv.reader(lines), start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if line_number == 1 and tuple(cell.strip().lower() for cell in row[:2]) in CSV_HEADERS:
+            continue
+        if len(row) < 2:
+            raise ValueError(f"Строка {line_number}: ожидается два столбца (вопрос, ответ).")
+        yield {'text': row[0].strip(), 'answer': row[1].strip()}
+
+
+# JSON Lines: {"title": ..., "mode": ..., "time_limit": ..., "start": ..., "end": ...}
+# и {"question": ..., "answer": ...} по одному на строку
+def iter_json_questions(lines, quiz_info):
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Строка {line_number}: некорректный JSON.")
+        if 'question' not in item and 'text' not in item:
+            if not any(key in item for key in ('title', 'mode', 'time_limit', 'start', 'end')):
+                raise ValueError(f"Строка {line_number}: нет поля question.")
+            if 'title' in item:
+                quiz_info['title'] = str(item['title']).strip()
+            if item.get('mode'):
+                parse_setting(quiz_info, 'mode', item['mode'])
+            if item.get('time_limit') is not None:
+                parse_setting(quiz_info, 'time_limit', item['time_limit'])
+            if item.get('start'):
+                parse_setting(quiz_info, 'start_time', item['start'])
+            if item.get('end'):
+                parse_setting(quiz_info, 'end_time', item['end'])
+            continue
+        yield {
+            'text': str(item.get('question', item.get('text'))).strip(),
+            'answer': str(item.get('answer', '')).strip(),
+        }
+
+
+QUESTION_PARSERS = {
+    'text': iter_text_questions,
+    'csv': iter_csv_questions,
+    'json': iter_json_questions,
+}
+
+
+def detect_format(file_name):
+    extension = os.path.splitext(file_name or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.json', '.jsonl'):
+        return 'json'
+    return 'text'
+
+
+# Функция для парсинга данных квиза из сообщения
+def parse_quiz_data(text):
+    quiz_info = {}
+    quiz_info['questions'] = list(iter_text_questions(text.strip().split('\n'), quiz_info))
+    return quiz_info
+
+
+async def _insert_quiz(session, quiz_info, question_count):
+    start_time = quiz_info.get('start_time')
+    end_time = quiz_info.get('end_time')
+    # Квиз с расписанием включает и выключает планировщик (quiz_schedule.py)
+    scheduled = start_time is not None or end_time is not None
+    if scheduled:
+        start_time = start_time or datetime.utcnow()
+        if end_time is not None and end_time <= start_time:
+            raise ValueError("Время окончания квиза должно быть позже начала.")
+    else:
+        start_time = datetime.utcnow()
+        end_time = start_time + timedelta(days=7)
+    result = await session.execute(
+        Quiz.__table__.insert().values(
+            title=quiz_info['title'],
+            is_active=False,
+            start_time=start_time,
+            end_time=end_time,
+            question_count=question_count,
+            question_time_limit=quiz_info.get('time_limit'),
+            is_scheduled=scheduled,
+            is_exam=quiz_info.get('exam', False),
+        )
+    )
+    return result.inserted_primary_key[0]
+
+
+async def _insert_questions(session, quiz_id, questions, last_question_id):
+    # Вопросы и ответы вставляются двумя executemany
+    await session.execute(
+        Question.__table__.insert(),
+        [{'quiz_id': quiz_id, 'text': q['text']} for q in questions],
+    )
+    # Идентификаторы новых вопросов квиза идут по возрастанию в порядке вставки
+    result = await session.execute(
+        select(Question.question_id)
+        .where(Question.quiz_id == quiz_id, Question.question_id > last_question_id)
+        .order_by(Question.question_id)
+    )
+    question_ids = [row.question_id for row in result.fetchall()]
+    await session.execute(
+        Answer.__table__.insert(),
+        [
+            {'question_id': question_id, 'text': q['answer']}
+            for question_id, q in zip(question_ids, questions)
+        ],
+    )
+    return question_ids[-1]
+
+
+async def _delete_quiz_rows(quiz_id):
+    async with async_session() as session:
+        await session.execute(
+            Answer.__table__.delete().where(
+                Answer.question_id.in_(
+                    select(Question.question_id).where(Question.quiz_id == quiz_id)
+                )
+            )
+        )
+        await session.execute(
+            Question.__table__.delete().where(Question.quiz_id == quiz_id)
+        )
+        await session.execute(
+            Quiz.__table__.delete().where(Quiz.quiz_id == quiz_id)
+        )
+        await session.commit()
+
+
+# Функция для сохранения квиза в базу данных (одна транзакция)
+async def save_quiz_to_db(quiz_info):
+    if not quiz_info.get('title'):
+        raise ValueError("Не указано название квиза.")
+    if not quiz_info['questions']:
+        raise ValueError("В квизе нет вопросов.")
+    async with async_session() as session:
+        quiz_id = await _insert_quiz(session, quiz_info, len(quiz_info['questions']))
+        await _insert_questions(session, quiz_id, quiz_info['questions'], 0)
+        await session.commit()
+    quiz_info['quiz_id'] = quiz_id
+    return quiz_id
+
+
+# Потоковый импорт большого файла: вопросы читаются и вставляются пачками
+async def import_quiz_file(path, file_format, default_title, progress=None,
+                           chunk_size=IMPORT_CHUNK_SIZE):
+    quiz_info = {'title': default_title}
+    quiz_id = None
+    last_question_id = 0
+    question_count = 0
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        questions = QUESTION_PARSERS[file_format](f, quiz_info)
+        try:
+            while True:
+                chunk = list(islice(questions, chunk_size))
+                if not chunk:
+                    break
+                async with async_session() as session:
+                    if quiz_id is None:
+                        quiz_id = await _insert_quiz(session, quiz_info, 0)
+                    last_question_id = await _insert_questions(
+                        session, quiz_id, chunk, last_question_id
+                    )
+                    question_count += len(chunk)
+                    await session.execute(
+                        Quiz.__table__.update()
+                        .where(Quiz.quiz_id == quiz_id)
+                        .values(question_count=question_count)
+                    )
+                    await session.commit()
+                if progress is not None:
+                    await progress(question_count)
+        except Exception:
+            # Не оставляем недогруженный квиз
+            if quiz_id is not None:
+                await _delete_quiz_rows(quiz_id)
+            raise
+    if quiz_id is None:
+        raise ValueError("В файле нет вопросов.")
+    return quiz_id, quiz_info['title'], question_count
@@ -0,0 +1,122 @@
+# quiz_schedule.py
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, or_
+
+from database import async_session, Quiz
+from leaderboard import leaderboards
+from quiz_cache import quiz_cache
+from quiz_catalog import quiz_catalog
+from timer_wheel import timer_wheel
+from config import QUIZ_SCHEDULE_RELOAD
+
+
+# Включение и выключение квиза; при выключении отмечаются победители.
+# manual=True - решение администратора, расписание квиза после этого не действует.
+async def set_quiz_active(quiz_id, active, manual=False):
+    values = {'is_active': active}
+    if manual:
+        values['is_scheduled'] = False
+    async with async_session() as session:
+        await session.execute(
+            Quiz.__table__.update().where(Quiz.quiz_id == quiz_id).values(**values)
+        )
+        await session.commit()
+    quiz_cache.invalidate(quiz_id)
+    quiz_catalog.invalidate()
+    if active:
+        return []
+    return await leaderboards.mark_winners(quiz_id)
+
+
+class QuizScheduler:
+    # Включает квизы в start_time и выключает в end_time с помощью общего
+    # колеса таймеров. Расписание перечитывается раз в QUIZ_SCHEDULE_RELOAD
+    # секунд: так подхватываются квизы, загруженные в других процессах.
+    def __init__(self, wheel=timer_wheel, reload_interval=QUIZ_SCHEDULE_RELOAD):
+        self.wheel = wheel
+        self.reload_interval = reload_interval
+        self._timers = {}  # quiz_id -> таймеры включения и выключения
+        self._reload_timer = None
+
+    async def start(self):
+        await self.reload()
+
+    def stop(self):
+        self.wheel.cancel(self._reload_timer)
+        self._reload_timer = None
+        for timers in self._timers.values():
+            for timer in timers:
+                self.wheel.cancel(timer)
+        self._timers.clear()
+
+    async def reload(self):
+        now = datetime.utcnow()
+        try:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(Quiz.quiz_id, Quiz.is_active, Quiz.start_time, Quiz.end_time)
+                    .where(
+                        Quiz.is_scheduled == True,
+                        or_(Quiz.is_active == True, Quiz.end_time == None, Quiz.end_time > now),
+                    )
+                )
+                quizzes = result.fetchall()
+            scheduled = set()
+            for quiz in quizzes:
+                scheduled.add(quiz.quiz_id)
+                await self._sync(quiz, now)
+            # Квизы, которые удалили или переключили вручную
+            for quiz_id in list(self._timers):
+                if quiz_id not in scheduled:
+                    self._cancel(quiz_id)
+        except Exception:
+            logging.exception("Не удалось обновить расписание квизов.")
+        self.wheel.cancel(self._reload_timer)
+        self._reload_timer = self.wheel.schedule(self.reload_interval, self.reload)
+
+    async def _sync(self, quiz, now):
+        self._cancel(quiz.quiz_id)
+        timers = []
+        if quiz.end_time is not None and quiz.end_time <= now:
+            if quiz.is_active:
+                logging.info(f"Квиз {quiz.quiz_id} выключен по расписанию.")
+                await set_quiz_active(quiz.quiz_id, False)
+            return
+        if quiz.start_time is None or quiz.start_time <= now:
+            if not quiz.is_active:
+                logging.info(f"Квиз {quiz.quiz_id} включен по расписанию.")
+                await set_quiz_active(quiz.quiz_id, True)
+        else:
+            timers.append(self.wheel.schedule(
+                (quiz.start_time - now).total_seconds(), self._fire, quiz.quiz_id
+            ))
+        if quiz.end_time is not None:
+            timers.append(self.wheel.schedule(
+                (quiz.end_time - now).total_seconds(), self._fire, quiz.quiz_id
+            ))
+        if timers:
+            self._timers[quiz.quiz_id] = timers
+
+    def _cancel(self, quiz_id):
+        for timer in self._timers.pop(quiz_id, ()):
+            self.wheel.cancel(timer)
+
+    async def _fire(self, quiz_id):
+        # Квиз перечитывается: расписание могли поменять или снять вручную
+        now = datetime.utcnow()
+        async with async_session() as session:
+            result = await session.execute(
+                select(Quiz.quiz_id, Quiz.is_active, Quiz.start_time, Quiz.end_time)
+                .where(Quiz.quiz_id == quiz_id, Quiz.is_scheduled == True)
+            )
+            quiz = result.fetchone()
+        if quiz is None:
+            self._cancel(quiz_id)
+            return
+        await self._sync(quiz, now)
+
+
+quiz_scheduler = QuizScheduler()
@@ -0,0 +1,187 @@
+# quiz_stats.py
+
+import asyncio
+import time
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy нужен только для /quiz_stats
+    np = None
+
+from sqlalchemy import select, func
+
+from database import engine, UserAttempt, UserResponse
+from quiz_cache import quiz_cache
+from config import STATS_CHUNK_SIZE, STATS_TOP_ANSWERS, STATS_CACHE_TTL
+
+QuestionStats = namedtuple('QuestionStats', ['question_id', 'text', 'responses', 'correct_rate', 'top_answers'])
+QuizStats = namedtuple('QuizStats', ['quiz_id', 'responses', 'finished_attempts', 'questions', 'score_histogram'])
+
+
+class ResponseColumns:
+    # Ответы квиза по столбцам: номер вопроса, код текста ответа, номер попытки.
+    # Тексты кодируются словарем, дальше все считается над массивами целых чисел,
+    # а проверка ответа выполняется один раз на пару (вопрос, текст), а не на строку.
+    def __init__(self, question_ids):
+        self.question_ids = np.asarray(sorted(question_ids), dtype=np.int64)
+        self.texts = []
+        self._codes = {}
+        self._questions = []
+        self._answers = []
+        self._attempts = []
+
+    def _code(self, text):
+        code = self._codes.get(text)
+        if code is None:
+            code = self._codes[text] = len(self.texts)
+            self.texts.append(text)
+        return code
+
+    def add(self, rows):
+        if not rows:
+            return
+        attempt_ids, question_ids, texts = zip(*rows)
+        question_ids = np.asarray(question_ids, dtype=np.int64)
+        positions = np.searchsorted(self.question_ids, question_ids)
+        # Ответы на вопросы, которых уже нет в квизе, не учитываются
+        known = positions < len(self.question_ids)
+        known[known] = self.question_ids[positions[known]] == question_ids[known]
+        answers = np.fromiter(map(self._code, texts), dtype=np.int64, count=len(texts))
+        self._questions.append(positions[known])
+        self._answers.append(answers[known])
+        self._attempts.append(np.asarray(attempt_ids, dtype=np.int64)[known])
+
+    def compute(self, quiz_id, questions, top_answers=STATS_TOP_ANSWERS):
+        # questions - CompiledQuestion квиза в порядке question_id
+        question_count = len(self.question_ids)
+        if self._questions:
+            question = np.concatenate(self._questions)
+            answer = np.concatenate(self._answers)
+            attempt = np.concatenate(self._attempts)
+        else:
+            question = answer = attempt = np.zeros(0, dtype=np.int64)
+        text_count = max(1, len(self.texts))
+
+        # Уникальные пары (вопрос, текст ответа) и сколько раз каждая встретилась
+        pairs, pair_index, pair_counts = np.unique(
+            question * text_count + answer, return_inverse=True, return_counts=True
+        )
+        pair_question = pairs // text_count
+        pair_answer = pairs % text_count
+        matchers = [compiled.matcher for compiled in questions]
+        pair_correct = np.fromiter(
+            (
+                matchers[q] is not None and matchers[q].match(self.texts[a])
+                for q, a in zip(pair_question.tolist(), pair_answer.tolist())
+            ),
+            dtype=bool,
+            count=len(pairs),
+        )
+        correct = pair_correct[pair_index.reshape(-1)]
+
+        responses = np.bincount(question, minlength=question_count)
+        correct_rate = np.divide(
+            np.bincount(question, weights=correct, minlength=question_count),
+            responses,
+            out=np.zeros(question_count),
+            where=responses > 0,
+        )
+
+        # Самые частые ответы: пары по вопросу, внутри вопроса - по убыванию числа
+        order = np.lexsort((-pair_counts, pair_question))
+        starts = np.searchsorted(pair_question[order], np.arange(question_count + 1))
+        question_stats = []
+        for position, compiled in enumerate(questions):
+            top = order[starts[position]:min(starts[position + 1], starts[position] + top_answers)]
+            question_stats.append(QuestionStats(
+                compiled.question_id,
+                compiled.text,
+                int(responses[position]),
+                float(correct_rate[position]),
+                [
+                    (self.texts[pair_answer[i]], int(pair_counts[i]), bool(pair_correct[i]))
+                    for i in top.tolist()
+                ],
+            ))
+
+        # Гистограмма баллов по попыткам, в которых отвечены все вопросы
+        _, attempt_index = np.unique(attempt, return_inverse=True)
+        attempt_index = attempt_index.reshape(-1)
+        answered = np.bincount(attempt_index)
+        scores = np.bincount(attempt_index, weights=correct).astype(np.int64)
+        finished = answered >= question_count
+        histogram = np.bincount(scores[finished], minlength=question_count + 1)
+        return QuizStats(
+            quiz_id,
+            int(len(question)),
+            int(finished.sum()),
+            question_stats,
+            histogram.tolist(),
+        )
+
+
+class QuizStatsCache:
+    # Посчитанная статистика хранится, пока по квизу не завершится новая попытка
+    # или не пройдет ttl секунд. TTL нужен процессам-обработчикам: invalidate()
+    # вызывается только в том процессе, где игрок закончил квиз.
+    def __init__(self, chunk_size=STATS_CHUNK_SIZE, ttl=STATS_CACHE_TTL):
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self._stats = {}  # quiz_id -> (статистика, когда устареет)
+        self._locks = {}
+        self._generations = {}  # quiz_id -> число сбросов, чтобы не сохранить устаревший расчет
+
+    def _cached(self, quiz_id):
+        entry = self._stats.get(quiz_id)
+        if entry is None:
+            return None
+        stats, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._stats[quiz_id]
+            return None
+        return stats
+
+    async def get(self, quiz_id):
+        stats = self._cached(quiz_id)
+        if stats is not None:
+            return stats
+        lock = self._locks.setdefault(quiz_id, asyncio.Lock())
+        async with lock:
+            stats = self._cached(quiz_id)
+            if stats is None:
+                generation = self._generations.get(quiz_id, 0)
+                stats = await self._compute(quiz_id)
+                if stats is not None and generation == self._generations.get(quiz_id, 0):
+                    self._stats[quiz_id] = (stats, time.monotonic() + self.ttl)
+        self._locks.pop(quiz_id, None)
+        return stats
+
+    def invalidate(self, quiz_id):
+        self._stats.pop(quiz_id, None)
+        self._generations[quiz_id] = self._generations.get(quiz_id, 0) + 1
+
+    async def _compute(self, quiz_id):
+        compiled = await quiz_cache.get(quiz_id)
+        if compiled is None:
+            return None
+        loop = asyncio.get_event_loop()
+        columns = ResponseColumns([question.question_id for question in compiled.questions])
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                select(
+                    UserResponse.attempt_id,
+                    UserResponse.question_id,
+                    func.coalesce(UserResponse.selected_answer_text, ''),
+                )
+                .join(UserAttempt, UserAttempt.attempt_id == UserResponse.attempt_id)
+                .where(UserAttempt.quiz_id == quiz_id)
+                .execution_options(yield_per=self.chunk_size)
+            )
+            async for rows in result.partitions(self.chunk_size):
+                # Перекладывание в массивы - в отдельном потоке, цикл событий свободен
+                await loop.run_in_executor(None, columns.add, [tuple(row) for row in rows])
+        return await loop.run_in_executor(None, columns.compute, quiz_id, compiled.questions)
+
+
+quiz_stats = QuizStatsCache()
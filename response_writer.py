@@ -0,0 +1,132 @@
+# response_writer.py
+
+import asyncio
+import logging
+
+from sqlalchemy.exc import OperationalError
+
+from database import async_session, UserResponse
+
+# Сколько ответов записывать одной транзакцией
+MAX_BATCH_SIZE = 500
+# Сколько ждать накопления пачки (секунды)
+FLUSH_INTERVAL = 0.05
+# Предел очереди: при переполнении обработчики ждут, память не растет
+MAX_QUEUE_SIZE = 10000
+# Повторы пачки при временных ошибках ("database is locked"): 0.1, 0.2, ... 1.6 с
+WRITE_RETRIES = 5
+RETRY_DELAY = 0.1
+
+
+class ResponseWriter:
+    # Отложенная запись UserResponse: ответы всех игроков пишутся пачками
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_queue_size=MAX_QUEUE_SIZE):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._busy = False
+        self._stopping = False
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0  # Ответов, которые так и не удалось записать
+
+    async def put(self, attempt_id, question_id, selected_answer_text):
+        await self._queue.put({
+            'attempt_id': attempt_id,
+            'question_id': question_id,
+            'selected_answer_text': selected_answer_text,
+        })
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping = True
+            # Прерываем задачу только в ожидании очереди, чтобы не потерять пачку
+            if not self._busy:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._stopping = False
+        await self.flush()
+
+    async def flush(self):
+        # Записывает все, что уже попало в очередь
+        async with self._lock:
+            while not self._queue.empty():
+                batch = []
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await self._write(batch)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'retries': self.retries,
+            'failed': self.failed,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while not self._stopping:
+            row = await self._queue.get()
+            self._busy = True
+            async with self._lock:
+                batch = [row]
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                await self._write(batch)
+            self._busy = False
+
+    async def _write(self, batch):
+        if not batch:
+            return
+        attempt = 0
+        while True:
+            try:
+                async with async_session() as session:
+                    # Список параметров -> executemany в одной транзакции
+                    await session.execute(UserResponse.__table__.insert(), batch)
+                    await session.commit()
+                break
+            except OperationalError:
+                # Игроки уже получили следующий вопрос, и ответ учтен в счете:
+                # пачку нельзя терять из-за временной блокировки базы.
+                # Пока идут повторы, новые ответы ждут в очереди.
+                if attempt >= WRITE_RETRIES:
+                    self._drop(batch)
+                    return
+                self.retries += 1
+                logging.warning(f"Запись {len(batch)} ответов не удалась, повтор {attempt + 1}.")
+                await asyncio.sleep(RETRY_DELAY * 2 ** attempt)
+                attempt += 1
+            except Exception:
+                self._drop(batch)
+                return
+        self.written += len(batch)
+        self.batches += 1
+
+    def _drop(self, batch):
+        self.failed += len(batch)
+        logging.exception(f"Не удалось записать {len(batch)} ответов пользователей.")
+
+
+response_writer = ResponseWriter()
@@ -0,0 +1,238 @@
+# sender.py
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+
+from aiogram.utils.exceptions import RetryAfter, NetworkError, RestartingTelegram
+
+from bot import bot
+from config import (
+    SEND_GLOBAL_RATE,
+    SEND_CHAT_RATE,
+    SEND_CHAT_BURST,
+    SENDER_WORKERS,
+    SEND_MAX_RETRIES,
+)
+
+# Приоритеты: ответы на действия пользователя раньше массовых рассылок
+INTERACTIVE = 0
+BULK = 1
+
+# Сколько чатов помнить; давно не активный чат и так имеет полный бакет
+MAX_CHAT_BUCKETS = 100000
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        # Забирает токен (баланс может уйти в минус) и возвращает, сколько ждать
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def take(self, now):
+        # Забирает токен, только если он есть; False - лимит исчерпан
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait(self):
+        # Сколько ждать следующего токена после неудачного take()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class SendJob:
+    __slots__ = ('chat_id', 'factory', 'future', 'enqueued_at', 'attempt', 'chat_reserved')
+
+    def __init__(self, chat_id, factory, future):
+        self.chat_id = chat_id
+        self.factory = factory
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempt = 0
+        self.chat_reserved = False
+
+
+class Sender:
+    # Единая очередь исходящих запросов к Telegram с общим лимитом и лимитами по чатам
+    def __init__(self, workers=SENDER_WORKERS, global_rate=SEND_GLOBAL_RATE,
+                 chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 max_retries=SEND_MAX_RETRIES):
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = OrderedDict()
+        self._queue = None
+        self._tasks = []
+        self._deferred = set()  # Таймеры отложенных заданий
+        self._sequence = itertools.count()
+        self._latencies = deque(maxlen=1000)
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            loop = asyncio.get_event_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10):
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(
+                f"Не отправлено сообщений при остановке: {self._queue.qsize() + len(self._deferred)}"
+            )
+        for handle in self._deferred:
+            handle.cancel()
+        self._deferred.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def call(self, chat_id, factory, priority=INTERACTIVE):
+        # factory - функция без аргументов, возвращающая корутину запроса к API
+        self._ensure_started()
+        future = asyncio.get_event_loop().create_future()
+        # Отложенное задание возвращается в очередь с теми же приоритетом и номером
+        self._queue.put_nowait((priority, next(self._sequence), SendJob(chat_id, factory, future)))
+        return await future
+
+    async def send_message(self, chat_id, text, priority=INTERACTIVE, **kwargs):
+        return await self.call(chat_id, lambda: bot.send_message(chat_id, text, **kwargs), priority)
+
+    async def reply(self, message, text, **kwargs):
+        return await self.send_message(
+            message.chat.id, text, reply_to_message_id=message.message_id, **kwargs
+        )
+
+    async def answer_callback(self, callback_query, text=None, show_alert=None):
+        # Ответ на нажатие кнопки не попадает в чат, поэтому лимит только общий
+        return await self.call(None, lambda: callback_query.answer(text, show_alert=show_alert))
+
+    async def send_document(self, chat_id, document, priority=INTERACTIVE, **kwargs):
+        return await self.call(chat_id, lambda: bot.send_document(chat_id, document, **kwargs), priority)
+
+    async def edit_text(self, message, text, **kwargs):
+        return await self.call(message.chat.id, lambda: message.edit_text(text, **kwargs))
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'deferred': len(self._deferred),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+            'latency_p99': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _reserve(self, job, now):
+        # Возвращает, сколько заданию ждать до отправки. Место в лимите чата
+        # бронируется один раз на попытку: этот лимит делят только сообщения
+        # одного чата. Общий токен берется только прямо перед отправкой:
+        # отложенная рассылка не занимает его заранее, и следующий свободный
+        # токен достается заданию с высшим приоритетом из очереди.
+        if job.chat_id is not None and not job.chat_reserved:
+            job.chat_reserved = True
+            delay = self._chat_bucket(job.chat_id).reserve(now)
+            if delay:
+                return delay
+        if self._global.take(now):
+            return 0.0
+        return self._global.wait()
+
+    def _defer(self, item, delay):
+        # Задание ждет вне очереди, а работник сразу берет следующее: чат,
+        # упершийся в лимит или во flood wait, не задерживает остальные.
+        # Пока задание отложено, оно числится в очереди, чтобы stop() его дождался.
+        handle = None
+
+        def release():
+            self._deferred.discard(handle)
+            self._queue.put_nowait(item)
+            self._queue.task_done()
+
+        handle = asyncio.get_event_loop().call_later(delay, release)
+        self._deferred.add(handle)
+
+    def _fail(self, job, error):
+        self.failed += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    async def _attempt(self, job):
+        # None - задание завершено; число - через сколько повторить
+        try:
+            result = await job.factory()
+        except RetryAfter as e:
+            # Telegram сам сообщает, сколько ждать
+            delay, error = e.timeout, e
+        except (NetworkError, RestartingTelegram) as e:
+            delay, error = 0.5 * 2 ** job.attempt, e
+        except Exception as e:
+            self._fail(job, e)
+            return None
+        else:
+            self.sent += 1
+            self._latencies.append(time.monotonic() - job.enqueued_at)
+            if not job.future.done():
+                job.future.set_result(result)
+            return None
+        if job.attempt >= self.max_retries:
+            self._fail(job, error)
+            return None
+        job.attempt += 1
+        job.chat_reserved = False
+        self.retries += 1
+        return delay
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            job = item[2]
+            if job.future.cancelled():
+                self._queue.task_done()
+                continue
+            delay = self._reserve(job, time.monotonic())
+            if not delay:
+                delay = await self._attempt(job)
+            if delay is not None:
+                self._defer(item, delay)
+            else:
+                self._queue.task_done()
+
+
+sender = Sender()
@@ -0,0 +1,227 @@
+# sqlite_storage.py
+
+import asyncio
+import copy
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import aiosqlite
+from aiogram.dispatcher.storage import BaseStorage
+
+# Сколько пользователей держать в памяти
+CACHE_SIZE = 10000
+# Как часто сбрасывать изменения на диск (секунды)
+FLUSH_INTERVAL = 0.5
+# Сбросить раньше срока, если накопилось столько изменений
+MAX_PENDING = 1000
+
+CREATE_TABLE = (
+    "CREATE TABLE IF NOT EXISTS fsm_state ("
+    "chat INTEGER NOT NULL, "
+    "user INTEGER NOT NULL, "
+    "state TEXT, "
+    "data TEXT, "
+    "PRIMARY KEY (chat, user)"
+    ") WITHOUT ROWID"
+)
+
+
+class SQLiteStorage(BaseStorage):
+    # Хранилище FSM в SQLite: горячие записи в LRU, запись на диск пачками.
+    # Запись пользователя: [state, data], где data - компактный dict
+    # (quiz_id, current_question, correct_answers, attempt_id).
+    def __init__(self, path, cache_size=CACHE_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_pending=MAX_PENDING):
+        self.path = path
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._db = None
+        self._connect_lock = None
+        self._flush_lock = None
+        self._flush_task = None
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._buckets = {}
+
+    # --- Подключение и сброс на диск ---
+
+    async def _connection(self):
+        if self._db is None:
+            if self._connect_lock is None:
+                self._connect_lock = asyncio.Lock()
+            async with self._connect_lock:
+                if self._db is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    db = await aiosqlite.connect(self.path)
+                    await db.execute("PRAGMA journal_mode=WAL")
+                    await db.execute("PRAGMA synchronous=NORMAL")
+                    await db.execute(CREATE_TABLE)
+                    await db.commit()
+                    self._db = db
+        return self._db
+
+    def _ensure_flusher(self):
+        if self._flush_task is None:
+            self._flush_lock = asyncio.Lock()
+            self._flush_task = asyncio.get_event_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("Не удалось сохранить состояния FSM.")
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        db = await self._connection()
+        async with self._flush_lock:
+            # Снимок берется под блокировкой: старые изменения не перезапишут новые
+            pending, self._dirty = self._dirty, {}
+            upserts = []
+            deletes = []
+            for (chat, user), (state, data) in pending.items():
+                if state is None and not data:
+                    deletes.append((chat, user))
+                else:
+                    upserts.append((chat, user, state, json.dumps(data, separators=(',', ':'))))
+            try:
+                if upserts:
+                    await db.executemany(
+                        "INSERT OR REPLACE INTO fsm_state (chat, user, state, data) VALUES (?, ?, ?, ?)",
+                        upserts,
+                    )
+                if deletes:
+                    await db.executemany(
+                        "DELETE FROM fsm_state WHERE chat = ? AND user = ?",
+                        deletes,
+                    )
+                await db.commit()
+            except Exception:
+                # Возвращаем изменения, если их не перезаписали новые
+                for key, record in pending.items():
+                    self._dirty.setdefault(key, record)
+                raise
+
+    # --- Кэш записей ---
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def _remember(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            # Несохраненная запись остается в _dirty до ближайшего сброса
+            self._cache.popitem(last=False)
+
+    async def _load(self, key):
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return record
+        record = self._dirty.get(key)
+        if record is None:
+            db = await self._connection()
+            async with db.execute(
+                "SELECT state, data FROM fsm_state WHERE chat = ? AND user = ?", key
+            ) as cursor:
+                row = await cursor.fetchone()
+            # Пока шел запрос, запись могла появиться в памяти
+            record = self._cache.get(key) or self._dirty.get(key)
+            if record is None:
+                record = [row[0], json.loads(row[1]) if row[1] else {}] if row else [None, {}]
+        self._remember(key, record)
+        return record
+
+    async def _store(self, key, record):
+        self._ensure_flusher()
+        self._remember(key, record)
+        self._dirty[key] = record
+        if len(self._dirty) >= self.max_pending:
+            await self.flush()
+
+    # --- Интерфейс BaseStorage ---
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+            await self.flush()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        record = await self._load(self._key(chat, user))
+        return record[0] if record[0] is not None else default
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        record = await self._load(self._key(chat, user))
+        return copy.deepcopy(record[1]) if record[1] else copy.deepcopy(default or {})
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key = self._key(chat, user)
+        record = await self._load(key)
+        # State из StatesGroup -> строка "Группа:состояние", как в MemoryStorage
+        await self._store(key, [self.resolve_state(state), record[1]])
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key = self._key(chat, user)
+        record = await self._load(key)
+        await self._store(key, [record[0], copy.deepcopy(data) if data else {}])
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        if data is None:
+            data = {}
+        key = self._key(chat, user)
+        record = await self._load(key)
+        new_data = dict(record[1])
+        new_data.update(data, **kwargs)
+        await self._store(key, [record[0], new_data])
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        key = self._key(chat, user)
+        record = await self._load(key)
+        await self._store(key, [None, {} if with_data else record[1]])
+
+    # Бакеты (используются троттлингом aiogram) держим только в памяти
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None):
+        key = self._key(chat, user)
+        return copy.deepcopy(self._buckets.get(key, default or {}))
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        self._buckets[self._key(chat, user)] = copy.deepcopy(bucket) if bucket else {}
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        if bucket is None:
+            bucket = {}
+        key = self._key(chat, user)
+        new_bucket = dict(self._buckets.get(key, {}))
+        new_bucket.update(bucket, **kwargs)
+        self._buckets[key] = new_bucket
+
+    def stats(self):
+        return {
+            'cached': len(self._cache),
+            'pending': len(self._dirty),
+        }
@@ -0,0 +1,105 @@
+# tests/test_backup.py
+#
+# Резервная копия заканчивается, пока другое соединение постоянно пишет в базу.
+#     python -m pytest tests
+
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from backup import BackupManager
+from timer_wheel import TimerWheel
+
+
+def make_database(path, rows):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE answers (id INTEGER PRIMARY KEY, text TEXT)")
+    db.executemany("INSERT INTO answers (text) VALUES (?)", (('x' * 200,) for _ in range(rows)))
+    db.commit()
+    db.close()
+
+
+def write_until(path, stop, written):
+    db = sqlite3.connect(path, timeout=5)
+    while not stop.is_set():
+        db.execute("INSERT INTO answers (text) VALUES ('новый ответ')")
+        db.commit()
+        written.append(1)
+        time.sleep(0.001)
+    db.close()
+
+
+def restore(snapshot, path):
+    with gzip.open(snapshot, 'rb') as packed, open(path, 'wb') as raw:
+        shutil.copyfileobj(packed, raw)
+    db = sqlite3.connect(path)
+    try:
+        assert db.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        return db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_backup_finishes_under_concurrent_writes(tmp_path):
+    source = str(tmp_path / 'quiz.db')
+    rows = 50000
+    make_database(source, rows)
+    manager = BackupManager(source=source, directory=str(tmp_path / 'backups'), keep=2, wheel=TimerWheel())
+
+    stop = threading.Event()
+    written = []
+    writer = threading.Thread(target=write_until, args=(source, stop, written))
+    writer.start()
+    try:
+        # Писатель уже работает, копия начинается посреди записи
+        while len(written) < 10:
+            time.sleep(0.001)
+        before = len(written)
+        result = asyncio.run(asyncio.wait_for(manager.backup(), 30))
+        during = len(written) - before
+    finally:
+        stop.set()
+        writer.join()
+        manager.stop()
+
+    # Запись не ждала, пока копия закончится
+    assert during > 0
+    restored = restore(result['path'], str(tmp_path / 'restored.db'))
+    assert rows + 10 <= restored <= rows + len(written)
+    assert result['pages'] > 0
+
+
+def test_backup_rotation(tmp_path):
+    source = str(tmp_path / 'quiz.db')
+    make_database(source, 100)
+    directory = tmp_path / 'backups'
+    manager = BackupManager(source=source, directory=str(directory), keep=2, wheel=TimerWheel())
+
+    async def run():
+        for _ in range(3):
+            await manager.backup()
+            # Имя копии содержит время с точностью до секунды
+            await asyncio.sleep(1.1)
+
+    try:
+        asyncio.run(run())
+    finally:
+        manager.stop()
+    snapshots = sorted(name for name in os.listdir(directory) if name.endswith('.db.gz'))
+    assert len(snapshots) == 2
+    with open(directory / 'backups.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 3
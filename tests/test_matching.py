@@ -0,0 +1,61 @@
+# tests/test_matching.py
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from matching import AnswerMatcher, SCAN_LIMIT, normalize_for_match
+
+
+def test_normalize_keeps_number_signs():
+    assert normalize_for_match('-5') == '-5'
+    assert normalize_for_match('−5') == '-5'
+    assert normalize_for_match('3.14') == '3.14'
+    assert normalize_for_match('3,14') == '3.14'
+    assert normalize_for_match('.5') == '.5'
+    assert normalize_for_match('1945-1953') == '1945-1953'
+    assert normalize_for_match('Ответ: 42.') == 'ответ 42'
+    assert normalize_for_match('Санкт-Петербург!') == 'санкт петербург'
+
+
+def test_negative_number_is_not_positive():
+    matcher = AnswerMatcher(['-5'])
+    assert matcher.match('-5')
+    assert matcher.match(' −5 ')
+    assert not matcher.match('5')
+
+
+def test_decimal_separators():
+    matcher = AnswerMatcher(['3.14'])
+    assert matcher.match('3,14')
+    assert matcher.match('3.14')
+    assert not matcher.match('3 14')
+    assert not matcher.match('314')
+
+
+def test_numbers_match_only_exactly():
+    matcher = AnswerMatcher(['3.14159', '1945'])
+    assert not matcher.match('3.14158')
+    assert not matcher.match('1946')
+    assert matcher.match('1945')
+
+
+def test_typos_in_words_still_match():
+    matcher = AnswerMatcher(['Александр Пушкин'])
+    assert matcher.match('александр пушкен')
+    assert not matcher.match('лев толстой')
+
+
+def test_long_answer_is_rejected_quickly():
+    # Вариантов больше SCAN_LIMIT - проверка идет через индекс удалений
+    variants = ['вариант ответа ' + 'абвгдежзиклмн'[i] for i in range(SCAN_LIMIT + 2)] + ['столица франции']
+    matcher = AnswerMatcher(variants)
+    assert matcher._deletions is not None
+    assert matcher.match('столица франци')
+    started = time.perf_counter()
+    assert not matcher.match('а' * 5000)
+    assert time.perf_counter() - started < 0.05
@@ -0,0 +1,188 @@
+# tests/test_quiz_import.py
+#
+# Разбор текстового, CSV и JSON форматов и потоковый импорт файла пачками
+# во временную базу.
+#     python -m pytest tests
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('aiosqlite')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import quiz_import
+from database import Base, Quiz, Question, Answer
+from quiz_import import (
+    iter_text_questions, iter_csv_questions, iter_json_questions, import_quiz_file, parse_quiz_data,
+)
+
+
+def text_quiz(count):
+    lines = ['Название квиза: Большой квиз', 'Время на вопрос: 30', 'Вопросы:']
+    for number in range(1, count + 1):
+        lines.append(f'{number}. Вопрос {number}?')
+        lines.append(f'Ответ: ответ {number}')
+    return lines
+
+
+def test_text_questions_and_settings():
+    quiz_info = {}
+    questions = list(iter_text_questions(text_quiz(2) + ['Режим: экзамен', 'Начало: 2030-01-02 10:00'], quiz_info))
+    assert questions == [
+        {'text': 'Вопрос 1?', 'answer': 'ответ 1'},
+        {'text': 'Вопрос 2?', 'answer': 'ответ 2'},
+    ]
+    assert quiz_info['title'] == 'Большой квиз'
+    assert quiz_info['time_limit'] == 30
+    assert quiz_info['exam'] is True
+    assert quiz_info['start_time'].hour == 10
+
+
+def test_text_questions_past_one_hundred():
+    quiz_info = parse_quiz_data('\n'.join(text_quiz(150)))
+    questions = quiz_info['questions']
+    assert len(questions) == 150
+    assert questions[99] == {'text': 'Вопрос 100?', 'answer': 'ответ 100'}
+    assert questions[-1] == {'text': 'Вопрос 150?', 'answer': 'ответ 150'}
+
+
+def test_text_rejects_bad_time_limit():
+    with pytest.raises(ValueError):
+        list(iter_text_questions(['Время на вопрос: полминуты'], {}))
+
+
+def test_csv_questions():
+    lines = ['вопрос,ответ', 'Столица Франции?,Париж', '', '"Да, или нет?",да|нет']
+    assert list(iter_csv_questions(lines, {})) == [
+        {'text': 'Столица Франции?', 'answer': 'Париж'},
+        {'text': 'Да, или нет?', 'answer': 'да|нет'},
+    ]
+
+
+def test_csv_rejects_single_column():
+    with pytest.raises(ValueError, match='Строка 2'):
+        list(iter_csv_questions(['Вопрос 1?,ответ', 'без ответа'], {}))
+
+
+def test_json_questions_and_settings():
+    quiz_info = {}
+    lines = [
+        json.dumps({'title': 'JSON квиз', 'mode': 'exam', 'time_limit': 20}, ensure_ascii=False),
+        json.dumps({'question': 'Два плюс два?', 'answer': 4}, ensure_ascii=False),
+        '',
+        json.dumps({'text': 'Цвет неба?', 'answer': 'синий'}, ensure_ascii=False),
+    ]
+    assert list(iter_json_questions(lines, quiz_info)) == [
+        {'text': 'Два плюс два?', 'answer': '4'},
+        {'text': 'Цвет неба?', 'answer': 'синий'},
+    ]
+    assert quiz_info == {'title': 'JSON квиз', 'exam': True, 'time_limit': 20}
+
+
+def test_json_rejects_bad_lines():
+    with pytest.raises(ValueError, match='Строка 1'):
+        list(iter_json_questions(['{не json'], {}))
+    with pytest.raises(ValueError, match='нет поля question'):
+        list(iter_json_questions(['{"answer": "да"}'], {}))
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    engine = create_async_engine('sqlite+aiosqlite:///' + str(tmp_path / 'quiz.db'))
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    # Импорт открывает сессии через quiz_import.async_session
+    monkeypatch.setattr(
+        quiz_import, 'async_session',
+        sessionmaker(engine, expire_on_commit=False, class_=AsyncSession),
+    )
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+def count_rows(engine):
+    async def run():
+        async with engine.connect() as conn:
+            return [
+                (await conn.execute(select(func.count()).select_from(model))).scalar()
+                for model in (Quiz, Question, Answer)
+            ]
+    return asyncio.run(run())
+
+
+def test_import_file_in_chunks(database, tmp_path):
+    path = tmp_path / 'quiz.txt'
+    path.write_text('\n'.join(text_quiz(150)), encoding='utf-8')
+    progress = []
+
+    async def report(count):
+        progress.append(count)
+
+    quiz_id, title, count = asyncio.run(
+        import_quiz_file(str(path), 'text', 'quiz.txt', progress=report, chunk_size=40)
+    )
+    assert (title, count) == ('Большой квиз', 150)
+    assert progress == [40, 80, 120, 150]
+
+    async def load():
+        async with database.connect() as conn:
+            quiz = (await conn.execute(
+                select(Quiz.question_count, Quiz.question_time_limit).where(Quiz.quiz_id == quiz_id)
+            )).one()
+            pairs = (await conn.execute(
+                select(Question.text, Answer.text)
+                .join(Answer, Answer.question_id == Question.question_id)
+                .where(Question.quiz_id == quiz_id)
+                .order_by(Question.question_id)
+            )).all()
+            return quiz, pairs
+
+    quiz, pairs = asyncio.run(load())
+    assert tuple(quiz) == (150, 30)
+    # Ответы каждой пачки привязаны к своим вопросам
+    assert [tuple(pair) for pair in pairs] == [
+        (f'Вопрос {number}?', f'ответ {number}') for number in range(1, 151)
+    ]
+
+
+def test_import_csv_uses_default_title(database, tmp_path):
+    path = tmp_path / 'capitals.csv'
+    path.write_text('question,answer\nСтолица Италии?,Рим\n', encoding='utf-8-sig')
+    quiz_id, title, count = asyncio.run(import_quiz_file(str(path), 'csv', 'capitals.csv'))
+    assert (title, count) == ('capitals.csv', 1)
+    assert count_rows(database) == [1, 1, 1]
+
+
+def test_failed_import_removes_partial_quiz(database, tmp_path):
+    path = tmp_path / 'broken.csv'
+    rows = [f'Вопрос {number}?,ответ {number}' for number in range(1, 61)]
+    # Ошибка во второй пачке: первая уже записана отдельной транзакцией
+    rows.insert(50, 'строка без ответа')
+    path.write_text('\n'.join(rows), encoding='utf-8')
+    with pytest.raises(ValueError, match='Строка 51'):
+        asyncio.run(import_quiz_file(str(path), 'csv', 'broken.csv', chunk_size=20))
+    assert count_rows(database) == [0, 0, 0]
+
+
+def test_import_empty_file(database, tmp_path):
+    path = tmp_path / 'empty.jsonl'
+    path.write_text('{"title": "Пусто"}\n', encoding='utf-8')
+    with pytest.raises(ValueError, match='нет вопросов'):
+        asyncio.run(import_quiz_file(str(path), 'json', 'empty.jsonl'))
+    assert count_rows(database) == [0, 0, 0]
@@ -0,0 +1,118 @@
+# tests/test_sender.py
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('aiogram')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from aiogram.utils.exceptions import RetryAfter
+
+from sender import Sender, BULK
+
+
+def request(sent, name):
+    async def send():
+        sent.append((name, time.monotonic()))
+        return name
+    return send
+
+
+def test_throttled_chat_does_not_block_other_chats():
+    async def run():
+        # Один работник: раньше он спал, пока чат 1 ждал своего лимита
+        sender = Sender(workers=1, global_rate=1000, chat_rate=1, chat_burst=1)
+        sent = []
+        started = time.monotonic()
+        slow = [
+            asyncio.ensure_future(sender.call(1, request(sent, f'slow{i}')))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        assert await sender.call(2, request(sent, 'fast')) == 'fast'
+        fast_at = dict(sent)['fast'] - started
+        assert await asyncio.gather(*slow) == ['slow0', 'slow1', 'slow2']
+        await sender.stop()
+        return fast_at, [name for name, _ in sent], time.monotonic() - started
+
+    fast_at, order, elapsed = asyncio.run(run())
+    assert fast_at < 0.2
+    assert order == ['slow0', 'fast', 'slow1', 'slow2']
+    # Лимит чата 1 по-прежнему соблюдается
+    assert elapsed >= 1.9
+
+
+def test_retry_after_does_not_block_worker():
+    async def run():
+        sender = Sender(workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        sent = []
+        attempts = []
+
+        async def flood():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(1)
+            return 'flood'
+
+        started = time.monotonic()
+        flooded = asyncio.ensure_future(sender.call(1, flood))
+        await asyncio.sleep(0.05)
+        assert await sender.call(2, request(sent, 'other')) == 'other'
+        other_at = sent[0][1] - started
+        assert await flooded == 'flood'
+        await sender.stop()
+        return other_at, attempts[1] - attempts[0], sender.stats()
+
+    other_at, retry_delay, stats = asyncio.run(run())
+    assert other_at < 0.5
+    assert retry_delay >= 0.9
+    assert stats['retries'] == 1 and stats['sent'] == 2 and stats['deferred'] == 0
+
+
+def test_stop_waits_for_deferred_messages():
+    async def run():
+        sender = Sender(workers=1, global_rate=1000, chat_rate=2, chat_burst=1)
+        sent = []
+        for i in range(3):
+            asyncio.ensure_future(sender.call(1, request(sent, i)))
+        await asyncio.sleep(0)
+        await sender.stop()
+        return sent
+
+    assert [name for name, _ in asyncio.run(run())] == [0, 1, 2]
+
+
+def test_interactive_messages_overtake_broadcast():
+    async def run():
+        # Настройки по умолчанию: 30 сообщений в секунду, рассылка в 25 потоков
+        sender = Sender(workers=50, global_rate=30, chat_rate=1, chat_burst=3)
+        sent = []
+
+        async def broadcast():
+            for chat_id in range(1000, 1100):
+                await sender.call(chat_id, request(sent, chat_id), priority=BULK)
+
+        bulk = [asyncio.ensure_future(broadcast()) for _ in range(25)]
+        await asyncio.sleep(1.5)
+        latencies = []
+        for chat_id in range(1, 11):
+            started = time.monotonic()
+            await sender.call(chat_id, request(sent, chat_id))
+            latencies.append(time.monotonic() - started)
+            await asyncio.sleep(0.05)
+        for task in bulk:
+            task.cancel()
+        await asyncio.gather(*bulk, return_exceptions=True)
+        await sender.stop(timeout=0)
+        return latencies
+
+    latencies = asyncio.run(run())
+    # Ответ ждет только ближайший токен (1/30 с), а не очередь рассылки
+    assert max(latencies) < 0.1
@@ -0,0 +1,128 @@
+# tests/test_workers.py
+#
+# Процесс-обработчик, запущенный через spawn, получает обновление и отвечает
+# на него через локальную заглушку Bot API.
+#     python -m pytest tests
+
+import asyncio
+import multiprocessing
+import os
+import runpy
+import sys
+import tempfile
+
+import pytest
+
+pytest.importorskip('aiogram')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from aiohttp import web
+
+from benchmarks.loadtest import FakeBotAPI
+
+USER_ID = 4242
+
+
+def configure(directory):
+    import config
+    config.DATABASE_URL = 'sqlite+aiosqlite:///' + os.path.join(directory, 'quiz.db')
+    config.FSM_DATABASE_PATH = os.path.join(directory, 'fsm.db')
+    config.METRICS_ENABLED = False
+    config.BACKUP_ENABLED = False
+    config.THROTTLE_ENABLED = True
+
+
+def run_worker(directory, port, updates_queue, counters, middlewares):
+    configure(directory)
+    # Как при запуске "python app.py": spawn выполняет модуль __main__
+    # родителя под именем __mp_main__, а _serve затем импортирует app
+    runpy.run_path(os.path.join(ROOT, 'app.py'), run_name='__mp_main__')
+
+    from aiogram.bot.api import TelegramAPIServer
+    from bot import bot
+    from workers import _prepare_database, worker_main
+
+    # Тот же импорт, что делает _serve
+    import app
+    middlewares.value = len(app.dp.middleware.applications)
+    bot.server = TelegramAPIServer.from_base(f'http://127.0.0.1:{port}')
+    asyncio.run(_prepare_database())
+    worker_main(0, updates_queue, counters)
+
+
+def start_update(update_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': USER_ID, 'type': 'private'},
+            'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'Игрок'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+
+async def serve_and_run_worker(directory):
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    context = multiprocessing.get_context('spawn')
+    updates_queue = context.Queue()
+    counters = context.Array('q', 1, lock=False)
+    middlewares = context.Value('i', 0, lock=False)
+    updates_queue.put(start_update(1))
+    updates_queue.put(None)
+    process = context.Process(
+        target=run_worker, args=(directory, port, updates_queue, counters, middlewares)
+    )
+    process.start()
+    try:
+        await asyncio.get_event_loop().run_in_executor(None, process.join, 60)
+    finally:
+        if process.is_alive():
+            process.kill()
+        await runner.cleanup()
+    return api, process.exitcode, counters[0], middlewares.value
+
+
+def test_spawned_worker_handles_update():
+    with tempfile.TemporaryDirectory() as directory:
+        api, exitcode, processed, middlewares = asyncio.run(serve_and_run_worker(directory))
+    assert exitcode == 0
+    # Модуль app выполнился дважды, но middleware должен стоять один раз
+    assert middlewares == 1
+    assert processed == 1
+    replies = api.inbox(USER_ID)
+    assert replies.qsize() == 1
+    assert replies.get_nowait()[1].startswith('Привет')
+
+
+@pytest.mark.parametrize('processes', [1, 8, 32])
+def test_worker_spreads_users_across_handler_queues(processes):
+    from webhook import UpdateQueue
+
+    async def run():
+        updates = UpdateQueue(None, workers=32, queue_size=32 * 100, shards=processes)
+        # Пользователи, которых роутер отдает процессу 3 (или 0 при одном процессе)
+        index = 3 % processes
+        user_ids = [user_id for user_id in range(1, 200000) if user_id % processes == index][:3200]
+        for user_id in user_ids:
+            assert updates.offer({
+                'update_id': user_id,
+                'message': {'from': {'id': user_id}, 'chat': {'id': user_id}},
+            })
+        return [queue.qsize() for queue in updates._queues]
+
+    sizes = asyncio.run(run())
+    assert all(size == 100 for size in sizes)
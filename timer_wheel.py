@@ -0,0 +1,147 @@
+# timer_wheel.py
+
+import asyncio
+import inspect
+import logging
+import math
+import time
+
+from config import TIMER_TICK
+
+# Уровни колеса: 4 уровня по 64 слота покрывают 64**4 тиков
+SLOT_BITS = 6
+LEVELS = 4
+
+
+class Timer:
+    __slots__ = ('expires', 'callback', 'args', '_slot')
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self._slot = None
+
+    @property
+    def active(self):
+        return self._slot is not None
+
+
+class TimerWheel:
+    # Иерархическое колесо таймеров: вставка и отмена - O(1), на каждом тике
+    # обрабатывается один слот нижнего уровня. Таймеры верхних уровней
+    # спускаются ниже ("каскад"), когда до их срабатывания остается меньше
+    # оборота нижнего уровня. Одна задача asyncio на весь процесс вместо
+    # отдельного asyncio.sleep на каждого игрока.
+    def __init__(self, tick=TIMER_TICK, slot_bits=SLOT_BITS, levels=LEVELS):
+        self.tick = tick
+        self.slot_bits = slot_bits
+        self.levels = levels
+        self._mask = (1 << slot_bits) - 1
+        self._range = 1 << (slot_bits * levels)
+        # Слот - словарь {таймер: None}: удаление по ключу за O(1), порядок сохраняется
+        self._wheel = [[{} for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self._current = 0
+        self._started = time.monotonic()
+        self._task = None
+        self._count = 0
+        self.fired = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, delay, callback, *args):
+        # callback вызывается с args; если он вернул корутину, она запускается задачей
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = Timer(self._current + ticks, callback, args)
+        self._insert(timer)
+        self._count += 1
+        return timer
+
+    def cancel(self, timer):
+        if timer is None or timer._slot is None:
+            return False
+        del timer._slot[timer]
+        timer._slot = None
+        self._count -= 1
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._started = time.monotonic() - self._current * self.tick
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _insert(self, timer):
+        delta = timer.expires - self._current
+        if delta < 0:
+            delta = 0
+        expires = timer.expires
+        if delta >= self._range:
+            # Дальше горизонта колеса: кладем в последний слот, при каскаде таймер переложится
+            delta = self._range - 1
+            expires = self._current + delta
+        level = 0
+        while delta >= 1 << (self.slot_bits * (level + 1)):
+            level += 1
+        slot = self._wheel[level][(expires >> (self.slot_bits * level)) & self._mask]
+        slot[timer] = None
+        timer._slot = slot
+
+    def _cascade(self, level):
+        index = (self._current >> (self.slot_bits * level)) & self._mask
+        slot = self._wheel[level][index]
+        if not slot:
+            return index
+        self._wheel[level][index] = {}
+        for timer in slot:
+            self._insert(timer)
+        return index
+
+    def advance(self, ticks=1):
+        for _ in range(ticks):
+            self._current += 1
+            # Слот уровня L разбирается, когда уровень L-1 прошел полный оборот
+            level = 1
+            while level < self.levels and (self._current & ((1 << (self.slot_bits * level)) - 1)) == 0:
+                self._cascade(level)
+                level += 1
+            index = self._current & self._mask
+            slot = self._wheel[0][index]
+            if not slot:
+                continue
+            self._wheel[0][index] = {}
+            for timer in slot:
+                timer._slot = None
+                self._count -= 1
+                self._fire(timer)
+
+    def _fire(self, timer):
+        self.fired += 1
+        try:
+            result = timer.callback(*timer.args)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result).add_done_callback(_log_failure)
+        except Exception:
+            logging.exception("Ошибка в обработчике таймера.")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            # Если цикл событий был занят, догоняем пропущенные тики
+            target = int((time.monotonic() - self._started) / self.tick)
+            if target > self._current:
+                self.advance(target - self._current)
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Ошибка в обработчике таймера.", exc_info=task.exception())
+
+
+timer_wheel = TimerWheel()
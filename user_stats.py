@@ -0,0 +1,62 @@
+# user_stats.py
+
+from datetime import timedelta
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from database import async_session, UserStats
+
+
+# Учитывает завершенную попытку одним UPSERT: счетчики и серия считаются
+# в самом запросе по старым значениям строки, без чтения истории попыток
+async def record_attempt(user_id, score, question_count, finished_at):
+    today = finished_at.date()
+    yesterday = today - timedelta(days=1)
+    streak = case(
+        (UserStats.last_played_on == today, UserStats.current_streak),
+        (UserStats.last_played_on == yesterday, UserStats.current_streak + 1),
+        else_=1,
+    )
+    statement = insert(UserStats.__table__).values(
+        user_id=user_id,
+        attempts=1,
+        total_score=score,
+        total_questions=question_count,
+        best_score=score,
+        current_streak=1,
+        best_streak=1,
+        last_played_on=today,
+        last_played_at=finished_at,
+    )
+    async with async_session() as session:
+        await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=['user_id'],
+                set_={
+                    'attempts': UserStats.attempts + 1,
+                    'total_score': UserStats.total_score + score,
+                    'total_questions': UserStats.total_questions + question_count,
+                    # max() с двумя аргументами в SQLite - скалярная функция
+                    'best_score': func.max(UserStats.best_score, score),
+                    'current_streak': streak,
+                    'best_streak': func.max(UserStats.best_streak, streak),
+                    'last_played_on': today,
+                    'last_played_at': finished_at,
+                },
+            )
+        )
+        await session.commit()
+
+
+async def get_user_stats(user_id):
+    async with async_session() as session:
+        result = await session.execute(select(UserStats).where(UserStats.user_id == user_id))
+        return result.scalar()
+
+
+# Серия продолжается, если последний квиз пройден сегодня или вчера
+def current_streak(stats, today):
+    if stats.last_played_on is None or stats.last_played_on < today - timedelta(days=1):
+        return 0
+    return stats.current_streak
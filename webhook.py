@@ -0,0 +1,218 @@
+# webhook.py
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from aiohttp import web, ClientSession
+from aiogram import Bot, Dispatcher, types
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WEBHOOK_WORKERS,
+    WEBHOOK_QUEUE_SIZE,
+)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Поля Update, в которых Telegram передает отправителя
+USER_UPDATE_FIELDS = (
+    'message',
+    'edited_message',
+    'callback_query',
+    'inline_query',
+    'chosen_inline_result',
+    'shipping_query',
+    'pre_checkout_query',
+    'poll_answer',
+    'my_chat_member',
+    'chat_member',
+    'chat_join_request',
+)
+
+
+# Идентификатор пользователя из "сырого" обновления (без сборки объектов aiogram)
+def update_user_id(data):
+    for field in USER_UPDATE_FIELDS:
+        obj = data.get(field)
+        if obj:
+            sender = obj.get('from') or obj.get('user')
+            if sender:
+                return sender.get('id', 0)
+            return 0
+    return 0
+
+
+class UpdateQueue:
+    # Очереди обновлений по пользователям: у каждого воркера своя очередь,
+    # поэтому обновления одного пользователя обрабатываются строго по порядку.
+    # shards - число процессов, между которыми роутер уже разделил пользователей
+    # по user_id % shards: в процесс попадают id с одним остатком, поэтому
+    # очередь выбирается по user_id // shards, иначе часть очередей простаивает.
+    def __init__(self, dp: Dispatcher, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE, shards=1):
+        self.dp = dp
+        self.shards = shards
+        self._queues = [
+            asyncio.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)
+        ]
+        self._tasks = []
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+
+    def start(self):
+        loop = asyncio.get_event_loop()
+        for queue in self._queues:
+            self._tasks.append(loop.create_task(self._worker(queue)))
+
+    async def stop(self):
+        # Дорабатываем то, что уже принято
+        for queue in self._queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _queue_for(self, data):
+        return self._queues[(update_user_id(data) // self.shards) % len(self._queues)]
+
+    async def put(self, data):
+        # Ждет места в очереди (для источников, которые могут подождать)
+        await self._queue_for(data).put(data)
+        self.accepted += 1
+
+    def offer(self, data):
+        # Возвращает False, если очередь переполнена
+        queue = self._queue_for(data)
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def stats(self):
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'errors': self.errors,
+            'queued': sum(queue.qsize() for queue in self._queues),
+        }
+
+    async def _worker(self, queue):
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        while True:
+            data = await queue.get()
+            try:
+                await self.dp.process_update(types.Update.to_object(data))
+                self.processed += 1
+            except Exception:
+                self.errors += 1
+                logging.exception("Ошибка при обработке обновления.")
+            finally:
+                queue.task_done()
+
+
+async def handle_webhook(request):
+    if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+        return web.Response(status=403)
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    # Очередь полна: Telegram повторит доставку позже
+    if not request.app['update_queue'].offer(data):
+        return web.Response(status=503)
+    return web.Response(status=200)
+
+
+def make_app(dp: Dispatcher, on_startup=None, on_shutdown=None):
+    app = web.Application()
+    app['update_queue'] = UpdateQueue(dp)
+    app.router.add_post(WEBHOOK_PATH, handle_webhook)
+
+    async def startup(app):
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        if on_startup is not None:
+            await on_startup(dp)
+        app['update_queue'].start()
+        if WEBHOOK_URL:
+            if WEBHOOK_SECRET:
+                await dp.bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+            else:
+                await dp.bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH)
+
+    async def shutdown(app):
+        await app['update_queue'].stop()
+        if on_shutdown is not None:
+            await on_shutdown(dp)
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        session = await dp.bot.get_session()
+        await session.close()
+
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    return app
+
+
+def start_webhook(dp: Dispatcher, on_startup=None, on_shutdown=None):
+    web.run_app(
+        make_app(dp, on_startup=on_startup, on_shutdown=on_shutdown),
+        host=WEBAPP_HOST,
+        port=WEBAPP_PORT,
+    )
+
+
+# Воспроизведение записанных обновлений (по одному JSON на строку) в локальный вебхук
+async def replay(path, url, concurrency=50):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+    headers = {SECRET_HEADER: WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+
+    async def post(session, update):
+        async with semaphore:
+            async with session.post(url, json=update, headers=headers) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    started = time.monotonic()
+    sent = 0
+    async with ClientSession() as session:
+        pending = set()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                update = json.loads(line)
+                update = update.get('update', update)
+                pending.add(asyncio.ensure_future(post(session, update)))
+                sent += 1
+                if len(pending) >= concurrency * 2:
+                    _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if pending:
+            await asyncio.wait(pending)
+    elapsed = time.monotonic() - started
+    print(f"Отправлено обновлений: {sent} за {elapsed:.2f} с ({sent / elapsed if elapsed else 0:.0f}/с)")
+    print(f"Ответы вебхука: {statuses}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Воспроизведение обновлений в локальный вебхук")
+    parser.add_argument('path', help="Файл с обновлениями, по одному JSON на строку")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(replay(args.path, args.url, args.concurrency))
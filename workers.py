@@ -0,0 +1,231 @@
+# workers.py
+
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_module
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from config import (
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WORKER_QUEUE_SIZE,
+    WORKER_REPORT_INTERVAL,
+)
+from webhook import SECRET_HEADER, update_user_id
+
+
+# --- Процесс-обработчик ---
+
+def worker_main(index, updates_queue, counters):
+    # Ctrl+C получает вся группа процессов; обработчик завершается по сигналу от роутера
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(_serve(index, updates_queue, counters))
+    loop.close()
+
+
+async def _serve(index, updates_queue, counters):
+    from app import dp, start_services, start_singleton_services, on_shutdown
+    from webhook import UpdateQueue
+
+    await start_services(dp, worker_index=index)
+    if index == 0:
+        await start_singleton_services(dp)
+    # Роутер уже разделил пользователей между процессами по user_id % len(counters)
+    updates = UpdateQueue(dp, shards=len(counters))
+    updates.start()
+    loop = asyncio.get_event_loop()
+    reader = ThreadPoolExecutor(max_workers=1)
+
+    async def publish_counter():
+        while True:
+            counters[index] = updates.processed
+            await asyncio.sleep(1)
+
+    publisher = loop.create_task(publish_counter())
+    logging.info(f"Обработчик {index} запущен.")
+    while True:
+        data = await loop.run_in_executor(reader, updates_queue.get)
+        if data is None:
+            break
+        await updates.put(data)
+
+    await updates.stop()
+    publisher.cancel()
+    counters[index] = updates.processed
+    await on_shutdown(dp)
+    await dp.storage.close()
+    await dp.storage.wait_closed()
+    session = await dp.bot.get_session()
+    await session.close()
+    reader.shutdown()
+
+
+# --- Роутер обновлений ---
+
+class UpdateRouter:
+    # Принимает обновления и раздает их процессам по хешу from_user.id,
+    # так что все обновления одного пользователя попадают в один процесс.
+    def __init__(self, queues, counters):
+        self.queues = queues
+        self.counters = counters
+        self.rejected = 0
+        self.started = time.monotonic()
+        self._last_counts = [0] * len(queues)
+        self._last_report = self.started
+
+    def _queue_for(self, data):
+        return self.queues[update_user_id(data) % len(self.queues)]
+
+    async def route(self, data):
+        worker_queue = self._queue_for(data)
+        try:
+            worker_queue.put_nowait(data)
+        except queue_module.Full:
+            # Ждем освобождения места, не блокируя цикл событий
+            await asyncio.get_event_loop().run_in_executor(None, worker_queue.put, data)
+
+    def offer(self, data):
+        try:
+            self._queue_for(data).put_nowait(data)
+        except queue_module.Full:
+            self.rejected += 1
+            return False
+        return True
+
+    def report(self):
+        now = time.monotonic()
+        interval = now - self._last_report
+        lines = []
+        for index in range(len(self.queues)):
+            processed = self.counters[index]
+            rate = (processed - self._last_counts[index]) / interval if interval else 0
+            lines.append(f"обработчик {index}: {processed} обновлений, {rate:.1f}/с")
+            self._last_counts[index] = processed
+        self._last_report = now
+        total = sum(self.counters[:])
+        uptime = now - self.started
+        logging.info(
+            "Пропускная способность: " + "; ".join(lines)
+            + f". Всего: {total}, в среднем {total / uptime if uptime else 0:.1f}/с, отклонено: {self.rejected}"
+        )
+
+    async def report_loop(self):
+        while True:
+            await asyncio.sleep(WORKER_REPORT_INTERVAL)
+            self.report()
+
+    async def poll(self):
+        from bot import bot, dp
+
+        await dp.skip_updates()
+        reporter = asyncio.get_event_loop().create_task(self.report_loop())
+        offset = None
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=20)
+                except Exception:
+                    logging.exception("Ошибка при получении обновлений.")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    offset = update.update_id + 1
+                    await self.route(update.to_python())
+        finally:
+            reporter.cancel()
+            session = await bot.get_session()
+            await session.close()
+
+    def make_app(self):
+        app = web.Application()
+
+        async def handle(request):
+            if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+                return web.Response(status=403)
+            try:
+                data = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            if not self.offer(data):
+                return web.Response(status=503)
+            return web.Response(status=200)
+
+        async def startup(app):
+            from bot import bot
+
+            app['reporter'] = asyncio.get_event_loop().create_task(self.report_loop())
+            if WEBHOOK_URL:
+                if WEBHOOK_SECRET:
+                    await bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+                else:
+                    await bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH)
+
+        async def shutdown(app):
+            from bot import bot
+
+            app['reporter'].cancel()
+            session = await bot.get_session()
+            await session.close()
+
+        app.router.add_post(WEBHOOK_PATH, handle)
+        app.on_startup.append(startup)
+        app.on_shutdown.append(shutdown)
+        return app
+
+
+async def _prepare_database():
+    from database import engine, init_db
+
+    await init_db()
+    # Соединения пула привязаны к этому циклу событий, закрываем их
+    await engine.dispose()
+
+
+def start_workers(count):
+    # Схема должна быть готова до того, как обработчики обратятся к базе
+    asyncio.run(_prepare_database())
+    # spawn: обработчики не наследуют состояние цикла событий и соединений роутера
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(count)]
+    counters = context.Array('q', count, lock=False)
+    processes = [
+        context.Process(
+            target=worker_main,
+            args=(index, queues[index], counters),
+            name=f'quiz-worker-{index}',
+        )
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    router = UpdateRouter(queues, counters)
+    try:
+        if BOT_MODE == 'webhook':
+            web.run_app(router.make_app(), host=WEBAPP_HOST, port=WEBAPP_PORT)
+        else:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(router.poll())
+            finally:
+                loop.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker_queue in queues:
+            worker_queue.put(None)
+        for process in processes:
+            process.join()
+        router.report()